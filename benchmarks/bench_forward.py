@@ -0,0 +1,79 @@
+""" microbenchmark: forward latency of ConvLSTM with long index input against the former float input and per-call conversions
+
+    usage: python -m benchmarks.bench_forward --batch-size 512 --max-length 30
+"""
+
+import time
+import argparse
+import torch
+
+from final_model.model import ConvLSTM
+from final_model.train_model import model_config
+
+
+def create_model() -> ConvLSTM:
+    return ConvLSTM(class_amount=10, embedding_size=model_config["embedding-size"], hidden_size=model_config["hidden-size"], layers=model_config["rnn-layers"], \
+                    dropout_chance=0.0, kernel_size=model_config["cnn-parameters"][1], channels=model_config["cnn-parameters"][2]).eval()
+
+
+def legacy_forward(model: ConvLSTM, x: torch.Tensor) -> torch.Tensor:
+    """ the former ConvLSTM.forward (float input of shape batch-size x max. length x 1) """
+
+    device = model.embedder.weight.device
+
+    x = model.embedder(x.type(torch.LongTensor).to(device=device))
+    x = x.squeeze(2).transpose(1, 2)
+    x = model.conv1(x)
+    x = x.transpose(1, 2)
+
+    hidden = (torch.zeros(model.layers, x.size(0), model.hidden_size).to(device=device), torch.zeros(model.layers, x.size(0), model.hidden_size).to(device=device))
+    x, _ = model.lstm(x)
+    x = x[:, -1]
+
+    x = model.dropout(x)
+    x = model.linear1(x)
+
+    return model.logSoftmax(x)
+
+
+def time_function(function, repeats: int=20) -> float:
+    """ returns the median latency in milliseconds """
+
+    function()
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+
+    return 1000 * sorted(latencies)[len(latencies) // 2]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-b", "--batch-size", type=int, default=512)
+    parser.add_argument("-l", "--max-length", type=int, default=30)
+    parser.add_argument("-r", "--repeats", type=int, default=20)
+    args = vars(parser.parse_args())
+
+    torch.manual_seed(0)
+    model = create_model()
+
+    lengths = torch.randint(5, args["max_length"] + 1, (args["batch_size"],))
+    names = torch.randint(1, 29, (args["batch_size"], args["max_length"]))
+    names[torch.arange(args["max_length"]).unsqueeze(0) >= lengths.unsqueeze(1)] = 0
+
+    float_names = names.float().unsqueeze(2)
+
+    with torch.inference_mode():
+        # both forward passes have to produce the same output
+        assert torch.allclose(legacy_forward(model, float_names), model(names), atol=1e-5)
+
+        legacy_latency = time_function(lambda: legacy_forward(model, float_names), args["repeats"])
+        latency = time_function(lambda: model(names), args["repeats"])
+        packed_latency = time_function(lambda: model(names, lengths), args["repeats"])
+
+    print("former forward (float input): {:.2f} ms".format(legacy_latency))
+    print("forward (long input):         {:.2f} ms - speedup: {:.2f}x".format(latency, legacy_latency / latency))
+    print("forward (packed sequences):   {:.2f} ms - speedup: {:.2f}x".format(packed_latency, legacy_latency / packed_latency))
@@ -0,0 +1,110 @@
+""" microbenchmark: batch name encoding (name_encoding.py) against the former per-character loops
+
+    usage: python -m benchmarks.bench_name_encoding --names 200000
+"""
+
+import time
+import string
+import random
+import argparse
+import numpy as np
+
+from name_encoding import normalize_names, encode_flat, encode_names
+
+
+def random_names(amount: int, seed: int=0) -> list:
+    random.seed(seed)
+    titles = ["", "", "", "", "Dr ", "mr ", "Mrs ", " "]
+
+    names = []
+    for _ in range(amount):
+        first_name = "".join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))).title()
+        surname = "".join(random.choices(string.ascii_lowercase + "-", k=random.randint(2, 12))).title()
+        names.append(random.choice(titles) + first_name + " " + surname)
+
+    return names
+
+
+def legacy_preprocessing(names: list) -> list:
+    """ the former name cleaning and encoding of preprocessing.py """
+
+    abc_dict = {}
+    abc_list = list(string.ascii_lowercase) + [" ", "-"]
+    for i in range(len(abc_list)):
+        abc_dict[abc_list[i]] = i
+
+    encoded = []
+    for name in names:
+        try:
+            name = name.lower()
+            if name.split(" ")[0] == "dr" or name.split(" ")[0] == "mr" or name.split(" ")[0] == "ms" or name.split(" ")[0] == "miss" or name.split(" ")[0] == "mrs":
+                space_idx = name.strip().index(" ")
+                name = name[space_idx:]
+
+            if list(name)[0] == " ":
+                name = name[1:]
+
+            name = name.strip()
+            matrix = []
+            for letter in name:
+                matrix.append(abc_dict[letter])
+            encoded.append(matrix)
+        except:
+            pass
+
+    return encoded
+
+
+def legacy_classify(names: list) -> list:
+    """ the former name encoding of classify.preprocess_names (without the tensor conversion) """
+
+    encoded = []
+    for name in names:
+        alphabet = list(string.ascii_lowercase.strip()) + [" ", "-"]
+        int_name = []
+        for char in name:
+            int_name.append(alphabet.index(char.lower()) + 1)
+        encoded.append(int_name)
+
+    return encoded
+
+
+def batch_preprocessing(names: list) -> tuple:
+    return encode_flat(normalize_names(names))
+
+
+def batch_classify(names: list) -> tuple:
+    return encode_names(normalize_names(names), index_offset=1)
+
+
+def time_function(function, names: list, repeats: int=3) -> float:
+    """ returns the best names/sec of several runs """
+
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(names)
+        best = min(best, time.perf_counter() - start)
+
+    return len(names) / best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--names", type=int, default=200000)
+    parser.add_argument("-r", "--repeats", type=int, default=3)
+    args = vars(parser.parse_args())
+
+    names = random_names(args["names"])
+    classify_names = [name.strip() for name in names]
+
+    # both implementations have to produce the same indices
+    codes, lengths, valid = batch_preprocessing(names)
+    assert [list(e) for e in np.split(codes, np.cumsum(lengths)[:-1])] == legacy_preprocessing(names)
+
+    for label, legacy, batch, inputs in [("preprocessing", legacy_preprocessing, batch_preprocessing, names),
+                                         ("classify", legacy_classify, batch_classify, classify_names)]:
+        legacy_speed = time_function(legacy, inputs, args["repeats"])
+        batch_speed = time_function(batch, inputs, args["repeats"])
+
+        print("{:<14} loops: {:>12,.0f} names/sec - batch: {:>12,.0f} names/sec - speedup: {:.1f}x".format(label, legacy_speed, batch_speed, batch_speed / legacy_speed))
@@ -0,0 +1,155 @@
+""" preprocessing benchmark on synthetic name corpora
+
+    generates corpora with the per-country size distribution of 'dataset/nationalityData.json' (scaled down by a factor),
+    runs 'preprocess_nationalities' and 'preprocess_groups' for representative class selections and reports wall time,
+    peak RSS and names/sec as JSON.
+
+    usage: python -m benchmarks.bench_preprocessing --scales 0.01 0.1 1.0 --out bench_preprocessing.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import multiprocessing
+import numpy as np
+
+from corpus import write_corpus
+
+
+NATIONALITY_DATA = "dataset/nationalityData.json"
+
+CASES = {
+    "2_nationalities": (False, ["german", "chinese"]),
+    "10_nationalities_and_else": (False, ["british", "german", "chinese", "dutch", "japanese", "indian", "spanish", "italian", "russian", "else"]),
+    "all_groups": (True, ["african", "angloAmerican", "eastAsian", "european", "hispanic", "arabic", "scandinavian", "southAsian"])
+}
+
+
+def generate_synthetic_corpus(corpus_path: str, scale: float=0.01, seed: int=0) -> int:
+    """ writes a corpus of random "firstname surname" names, every country gets 'scale' times its real amount of names
+
+    :param str corpus_path: directory to write the corpus to
+    :param float scale: scale factor of the per-country name amounts (1.0 = full size)
+    :param int seed: random seed
+    :return int: total amount of names
+    """
+
+    rng = np.random.default_rng(seed)
+
+    with open(NATIONALITY_DATA, "r") as f:
+        real_sizes = json.load(f)["nationalities"]
+
+    countries, start = {}, 0
+    for country, size in real_sizes.items():
+        size = max(2, int(size * scale))
+        countries[country] = [start, start + size]
+        start += size
+
+    total_names = start
+    first_lengths = rng.integers(2, 10, size=total_names)
+    surname_lengths = rng.integers(2, 13, size=total_names)
+    lengths = first_lengths + 1 + surname_lengths
+
+    offsets = np.zeros(total_names + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    chars = rng.integers(ord("a"), ord("z") + 1, size=offsets[-1], dtype=np.uint8)
+    chars[offsets[:-1] + first_lengths] = ord(" ")
+
+    # capital initials and some titles, like in the real data
+    chars[offsets[:-1]] -= 32
+    titled = np.flatnonzero((rng.random(total_names) < 0.05) & (first_lengths >= 5))
+    for idx, char in enumerate(b"mr "):
+        chars[offsets[titled] + idx] = char
+
+    write_corpus(corpus_path, countries, chars, offsets)
+
+    return total_names
+
+
+def _run_case(corpus_path: str, case: str, workers: int, queue: multiprocessing.Queue) -> None:
+    """ runs one preprocessing case inside a fresh process, so the peak RSS only belongs to that case """
+
+    from preprocessing import preprocess_nationalities, preprocess_groups
+
+    is_group_level, classes = CASES[case]
+
+    working_directory = tempfile.mkdtemp()
+    os.chdir(working_directory)
+    os.makedirs("nec_user_models/" + case + "/dataset")
+
+    start = time.perf_counter()
+    if is_group_level:
+        preprocess_groups(job_id=case, groups=classes, corpus_path=corpus_path, seed=0, workers=workers)
+    else:
+        preprocess_nationalities(job_id=case, nationalities=classes, corpus_path=corpus_path, seed=0, workers=workers)
+    wall_time = time.perf_counter() - start
+
+    dataset_size = len(np.load("nec_user_models/" + case + "/dataset/classes.npy"))
+    shutil.rmtree(working_directory)
+
+    # ru_maxrss is given in kilobytes on linux
+    queue.put({
+        "wall-time": round(wall_time, 4),
+        "peak-rss-mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak-worker-rss-mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "dataset-size": dataset_size,
+        "names-per-sec": round(dataset_size / wall_time, 1)
+    })
+
+
+def run_benchmark(scales: list, workers: int=1, cases: list=list(CASES.keys())) -> list:
+    context = multiprocessing.get_context("spawn")
+    results = []
+
+    corpus_directory = tempfile.mkdtemp()
+    try:
+        for scale in scales:
+            corpus_path = corpus_directory + "/corpus_" + str(scale)
+
+            # the peak RSS is inherited by forked processes, so the benchmark process itself has to stay small
+            process = context.Process(target=generate_synthetic_corpus, args=(corpus_path, scale))
+            process.start()
+            process.join()
+
+            with open(corpus_path + "/countries.json", "r") as f:
+                total_names = max([end for _, end in json.load(f)["countries"].values()])
+
+            for case in cases:
+                queue = context.Queue()
+                process = context.Process(target=_run_case, args=(os.path.abspath(corpus_path), case, workers, queue))
+                process.start()
+                result = queue.get()
+                process.join()
+
+                result.update({"case": case, "scale": scale, "corpus-size": total_names, "workers": workers})
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr)
+
+            shutil.rmtree(corpus_path)
+    finally:
+        shutil.rmtree(corpus_directory)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--scales", type=float, nargs="+", default=[0.01, 0.1, 1.0])
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument("-c", "--cases", nargs="+", default=list(CASES.keys()), choices=list(CASES.keys()))
+    parser.add_argument("-o", "--out", default=None)
+    args = vars(parser.parse_args())
+
+    results = run_benchmark(args["scales"], workers=args["workers"], cases=args["cases"])
+
+    if args["out"] is not None:
+        with open(args["out"], "w") as f:
+            json.dump(results, f, indent=4)
+    else:
+        print(json.dumps(results, indent=4))
@@ -2,17 +2,18 @@
 import torch
 import torch.utils.data
 import torch.nn as nn
-from torch.nn.utils.rnn import pad_sequence
 import argparse
 import numpy as np
 import json
 import pandas as pd
-import string
 from typing import Union
+import io
 import os
 import time
 import traceback
 from utils import load_json, write_json
+from name_encoding import normalize_names, encode_names
+from prediction_cache import PredictionCache, model_hash
 
 import sys
 sys.path.insert(1, "/final_model/")
@@ -20,51 +21,123 @@ sys.path.insert(1, "/final_model/")
 from final_model.model import ConvLSTM as Model
 
 
-def preprocess_names(names: list=[str], batch_size: int=128) -> torch.tensor:
-    """ create a pytorch-usable input-batch from a list of string-names
-    
-    :param list names: list of names (strings)
-    :param int batch_size: batch-size for the forward pass
-    :return torch.tensor: preprocessed names (to tensors, padded, encoded)
+MODELS_DIRECTORY = "nec-model/nec_user_models/"
+CSV_INPUT_DIRECTORY = "nec-model/tmp-csv/"
+CSV_OUTPUT_DIRECTORY = "src/data/output-files/"
+
+# characters (amount names x longest name) per batch and cpu thread
+TOKENS_PER_THREAD = 8192
+
+# amount of csv rows which are read, classified and written at once
+CSV_CHUNK_SIZE = 100000
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+
+def token_budget(model_config: dict) -> int:
+    """ chooses the size of the batches from the cpu threads and the available memory
+
+    :param dict model_config: train configuration of the model
+    :return int: maximum amount of characters (amount names x longest name) per batch
     """
 
-    sample_batch = []
-    for name in names:
+    budget = torch.get_num_threads() * TOKENS_PER_THREAD
+
+    # float32 activations of one character: embedding, convolution features and the LSTM gates and states of every layer
+    bytes_per_token = 4 * (model_config["embedding-size"] + model_config["cnn-parameters"][2][-1] + 6 * model_config["hidden-size"] * model_config["rnn-layers"])
 
-        # create index-representation from string name, ie: "joe" -> [10, 15, 5], indices go from 1 ("a") to 28 ("-")
-        alphabet = list(string.ascii_lowercase.strip()) + [" ", "-"]
-        int_name = []
-        for char in name:
-            int_name.append(alphabet.index(char.lower()) + 1)
-        
-        name = torch.tensor(int_name)
-        sample_batch.append(name)
+    # the activations of a batch may take at most a quarter of the available memory
+    try:
+        available_memory = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        budget = min(budget, available_memory // (4 * bytes_per_token))
+    except (ValueError, OSError, AttributeError):
+        pass
 
-    padded_batch = pad_sequence(sample_batch, batch_first=True)
+    return max(int(budget), 1)
 
-    padded_to = list(padded_batch.size())[1]
-    padded_batch = padded_batch.reshape(len(sample_batch), padded_to, 1).to(device=device)
 
-    if padded_batch.shape[0] == 1 or batch_size == padded_batch.shape[0]:
-        padded_batch = padded_batch.unsqueeze(0)
-    else:
-        padded_batch = torch.split(padded_batch, batch_size)
+def split_batches(padded_names: np.ndarray, lengths: np.ndarray, max_tokens: int=8192, min_length: int=1, pad_to_longest: bool=False) -> tuple:
+    """ sorts encoded names by length and splits them into batches of at most 'max_tokens' characters
+
+    :param np.ndarray padded_names: encoded and padded names (amount names x longest name)
+    :param np.ndarray lengths: lengths of the names
+    :param int max_tokens: maximum amount of characters (amount names x longest name) per batch
+    :param int min_length: minimum padded length of a batch (the convolution needs at least its kernel size)
+    :param bool pad_to_longest: pad every batch to the full width of 'padded_names'
+    :return list, list, np.ndarray: padded name tensors and their lengths, both split into batches, and the index of every sorted name in 'padded_names'
+    """
+
+    if pad_to_longest:
+        min_length = max(min_length, padded_names.shape[1])
+
+    order = np.argsort(lengths, kind="stable")
+    sorted_lengths = lengths[order]
+
+    input_batch, length_batch = [], []
+
+    start = 0
+    while start < len(order):
+        # the names are sorted, so the longest name of a batch is its last one
+        end = min(start + max(max_tokens // max(int(sorted_lengths[start]), min_length), 1), len(order))
+        end = min(start + max(max_tokens // max(int(sorted_lengths[end - 1]), min_length), 1), len(order))
+
+        padded_to = max(int(sorted_lengths[end - 1]), min_length)
+        batch_names = np.zeros((end - start, padded_to), dtype=padded_names.dtype)
+        batch_names[:, :min(padded_to, padded_names.shape[1])] = padded_names[order[start:end], :padded_to]
+
+        # long index tensor (amount names x longest name), the model embeds it without any conversion
+        input_batch.append(torch.from_numpy(batch_names).to(device=device))
+        length_batch.append(torch.from_numpy(sorted_lengths[start:end]))
+
+        start = end
+
+    return input_batch, length_batch, order
+
+
+def restore_order(values: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """ scatters values of the length-sorted names back to the original order of the names
 
-    return padded_batch
+    :param np.ndarray values: values in the order of the sorted names
+    :param np.ndarray order: index of every sorted name in the original names
+    :return np.ndarray: values in the original order
+    """
+
+    restored = np.empty_like(values)
+    restored[order] = values
+
+    return restored
     
 
-def predict(input_batch: torch.tensor, model_config: dict, device: torch.device) -> str:
-    """ load model and predict preprocessed name
+def load_model(model_id: str, device: torch.device=device) -> tuple:
+    """ load a model with its classes and train configuration
 
-    :param torch.tensor input_batch: input-batch
-    :param str model_path: path to saved model-paramters
-    :param dict classes: a dictionary containing all countries with their class-number
-    :return str: predicted ethnicities
+    :param str model_id: id of the model (name of its directory in the models directory)
+    :param torch.device device: device to load the model to (the quantized inference model always runs on the cpu)
+    :return torch.nn.Module, dict, dict, str: model (in eval-mode), classes, train configuration and hash of the loaded model file
     """
 
+    model_directory = MODELS_DIRECTORY + model_id + "/"
+
+    # prefer the int8-quantized TorchScript model, it's faster to load and to run and has its classes and config embedded
+    if os.path.exists(model_directory + "model_inference.pt"):
+        # the hash is computed from the loaded bytes, so it always belongs to the model in memory
+        model_bytes = read_bytes(model_directory + "model_inference.pt")
+
+        extra_files = {"nationalities.json": "", "config.json": ""}
+        model = torch.jit.load(io.BytesIO(model_bytes), map_location="cpu", _extra_files=extra_files)
+
+        classes = json.loads(extra_files["nationalities.json"])
+        model_config = json.loads(extra_files["config.json"])
+
+        return model.eval(), classes, model_config, model_hash(model_bytes)
+
+    model_config = load_json(model_directory + "config.json")
+    classes = load_json(model_directory + "dataset/nationalities.json")
+    model_bytes = read_bytes(model_directory + "model.pt")
+
     # prepare model (map model-file content from gpu to cpu if necessary)
     model = Model(
-                class_amount=model_config["amount-classes"], 
+                class_amount=len(classes), 
                 embedding_size=model_config["embedding-size"],
                 hidden_size=model_config["hidden-size"],
                 layers=model_config["rnn-layers"],
@@ -72,91 +145,198 @@ def predict(input_batch: torch.tensor, model_config: dict, device: torch.device)
                 channels=model_config["cnn-parameters"][2]
             ).to(device=device)
 
+    if device != torch.device("cuda:0"):
+        model.load_state_dict(torch.load(io.BytesIO(model_bytes), map_location={"cuda:0": "cpu"}))
+    else:
+        model.load_state_dict(torch.load(io.BytesIO(model_bytes)))
 
-    model_path = model_config["model-file"]
+    return model.eval(), classes, model_config, model_hash(model_bytes)
 
-    if device != "cuda:0":
-        model.load_state_dict(torch.load(model_path, map_location={"cuda:0": "cpu"}))
-    else:
-        model.load_state_dict(torch.load(model_path))
 
-    model = model.eval()
+def read_bytes(file_path: str) -> bytes:
+    """ reads the content of a file """
 
-    # classify names    
-    total_predicted_ethncitities = []
+    with open(file_path, "rb") as f:
+        return f.read()
 
-    for batch in input_batch:
-        predictions = model(batch.float())
 
-        # convert numerics to country name
-        predicted_ethnicites = []
-        for idx in range(len(predictions)):
-            prediction = predictions.cpu().detach().numpy()[idx]
-            prediction_idx = list(prediction).index(max(prediction))
-            ethnicity = list(classes.keys())[list(classes.values()).index(prediction_idx)]
-            predicted_ethnicites.append(ethnicity)
+def predict(input_batch: list, model: torch.nn.Module, model_config: dict, length_batch: list=None) -> np.ndarray:
+    """ predict preprocessed names
 
-        total_predicted_ethncitities += predicted_ethnicites
+    :param list input_batch: input-batches
+    :param torch.nn.Module model: loaded model (see 'load_model')
+    :param dict model_config: train configuration of the model
+    :param list length_batch: lengths of the names in the input-batches, only used by models trained on packed sequences
+    :return np.ndarray: float32 probabilities of the classes (amount names x amount classes)
+    """
 
-    return total_predicted_ethncitities
-    
+    packed_sequences = model_config.get("packed-sequences", False)
 
-if __name__ == "__main__":
-    # read flag arguments
-    try:
-        parser = argparse.ArgumentParser()
-        parser.add_argument("-i", "--id", required=True)
-        parser.add_argument("-f", "--fileName", required=True)
-        args = vars(parser.parse_args())
+    # classify names, the predictions are only copied to the cpu once per batch
+    probabilities = []
 
-        # get input and output path
+    with torch.inference_mode():
+        for batch_idx, batch in enumerate(input_batch):
+            lengths = length_batch[batch_idx] if packed_sequences else None
+            probabilities.append(torch.exp(model(batch, lengths)).float().cpu())
 
-        model_id = args["id"]
+    return torch.cat(probabilities).numpy() if len(probabilities) > 0 else np.empty((0, 0), dtype=np.float32)
 
-        csv_in_path = "nec-model/tmp-csv/" + args["fileName"].split(".")[0] + "_in_" + model_id + ".csv"
-        csv_out_path = "src/data/output-files/" + args["fileName"].split(".")[0] + "_out_" + model_id + ".csv" 
 
-        # get the train configurations
-        model_config = load_json("nec-model/nec_user_models/" + model_id + "/config.json")
-        classes = load_json("nec-model/nec_user_models/" + model_id + "/dataset/nationalities.json")
-        model_file = "nec-model/nec_user_models/" + model_id + "/model.pt"
-        names = pd.read_csv(csv_in_path)["names"].tolist()
-        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-        batch_size = 32
+def decode_predictions(probabilities: np.ndarray, classes: dict, top_k: int=0) -> tuple:
+    """ converts class probabilities to country names
 
-        # preprocess inputs
-        input_batch = preprocess_names(names=names, batch_size=batch_size)
+    :param np.ndarray probabilities: probabilities of the classes (amount names x amount classes)
+    :param dict classes: a dictionary containing all countries with their class-number
+    :param int top_k: amount of most likely ethnicities (and their probabilities) to return per name, none if 0
+    :return np.ndarray, np.ndarray, np.ndarray: predicted ethnicities, top-k ethnicities and top-k probabilities (amount names x top_k)
+    """
 
-        model_config = {
-            "model-file": model_file,
-            "amount-classes": len(classes),
-            "embedding-size": model_config["embedding-size"],
-            "hidden-size": model_config["hidden-size"],
-            "rnn-layers": model_config["rnn-layers"],
-            "cnn-parameters": model_config["cnn-parameters"]
-        }
+    top_k = min(top_k, len(classes))
+    probabilities = probabilities.reshape(-1, len(classes))
 
-        # predict ethnicities
-        ethnicities = predict(input_batch, model_config, device)
+    # class-number -> country name
+    labels = np.empty(len(classes), dtype=object)
+    labels[list(classes.values())] = list(classes.keys())
 
-        df = pd.DataFrame()
-        df["names"] = names
-        df["ethnicities"] = ethnicities
+    ethnicities = labels[probabilities.argmax(axis=1)]
 
-        open(csv_out_path, "w+").close()
-        df.to_csv(csv_out_path, index=False)
+    # most likely classes first
+    top_k_indices = np.argsort(-probabilities, axis=1, kind="stable")[:, :top_k]
 
-        # remove temporary csv file
-        os.remove(csv_in_path)
+    return ethnicities, labels[top_k_indices], np.take_along_axis(probabilities, top_k_indices, axis=1)
 
-        print("\n-> classified names using the model with id {}.".format(model_id))
-    except Exception as e:
-        print(traceback.format_exc())
 
+def classify_names(names: list, loaded_models: dict, top_k: int=0, prediction_cache: PredictionCache=None) -> pd.DataFrame:
+    """ classify a list of names with one or more models, the names are normalized and encoded once for all models and every distinct name only gets classified once
+
+    :param list names: list of names (strings)
+    :param dict loaded_models: model id -> model, classes, train configuration and model hash (see 'load_model')
+    :param int top_k: adds the columns "ethnicity-i" and "probability-i" of the i-th most likely ethnicities (i = 1 ... top_k)
+    :param PredictionCache prediction_cache: cache of already classified names (not used if None, only used for models trained on packed sequences)
+    :return pd.DataFrame: names and their predicted ethnicities, the columns get the model id as suffix ("ethnicities-<model id>") if there are several models
+    """
 
+    # names which are equal after the normalization get the same prediction
+    unique_names, inverse = np.unique(np.asarray(normalize_names(names), dtype=object), return_inverse=True)
+    inverse = inverse.reshape(-1)
 
-    
+    # create index-representation from string names, ie: "joe" -> [10, 15, 5], indices go from 1 ("a") to 28 ("-")
+    padded_names, lengths, valid = encode_names(unique_names.tolist(), index_offset=1)
+
+    if not valid.all():
+        raise ValueError("names may only contain the letters a-z, spaces and hyphens: {}".format(unique_names[~valid][:10].tolist()))
+
+    df = pd.DataFrame()
+    df["names"] = names
+
+    for model_id, (model, classes, model_config, model_hash_) in loaded_models.items():
+        # the cached predictions of a model are only valid for the model file they were computed with
+        model_key = model_id + "_" + model_hash_
+
+        # models trained without packed sequences read their output at the last padded step, so their prediction of a name depends on the other names of the batch and can't be cached
+        use_cache = prediction_cache is not None and model_config.get("packed-sequences", False)
+
+        probabilities = np.zeros((len(unique_names), len(classes)), dtype=np.float32)
+        uncached = np.ones(len(unique_names), dtype=bool)
+
+        if use_cache:
+            cached = prediction_cache.get(model_key, unique_names.tolist(), len(classes))
+            for idx, name in enumerate(unique_names):
+                if name in cached:
+                    probabilities[idx] = cached[name]
+                    uncached[idx] = False
+
+        if uncached.any():
+            # models trained without packed sequences read their output at the last padded step, so they keep getting the names padded to the longest one
+            input_batch, length_batch, order = split_batches(padded_names[uncached], lengths[uncached], max_tokens=token_budget(model_config), \
+                                                             min_length=model_config["cnn-parameters"][1], pad_to_longest=not model_config.get("packed-sequences", False))
+
+            # predict ethnicities, the batches are sorted by name length, restore the order of the names
+            probabilities[uncached] = restore_order(predict(input_batch, model, model_config, length_batch=length_batch), order)
+
+            if use_cache:
+                prediction_cache.put(model_key, unique_names[uncached].tolist(), probabilities[uncached])
+
+        ethnicities, top_k_ethnicities, top_k_probabilities = decode_predictions(probabilities[inverse], classes, top_k=top_k)
+
+        # a single model keeps the plain column names
+        suffix = "-" + model_id if len(loaded_models) > 1 else ""
+
+        df["ethnicities" + suffix] = ethnicities
+
+        for i in range(top_k_ethnicities.shape[1]):
+            df["ethnicity-" + str(i + 1) + suffix] = top_k_ethnicities[:, i]
+            df["probability-" + str(i + 1) + suffix] = np.round(top_k_probabilities[:, i], 5)
+
+    return df
+
+
+def classify_file(model_ids: Union[str, list], file_name: str, loaded_models: list=None, top_k: int=0, chunk_size: int=CSV_CHUNK_SIZE, prediction_cache: PredictionCache=None) -> str:
+    """ classify the names of an uploaded csv file with one or more models and write the results to the output directory
 
+    :param str/list model_ids: id of the model or list of model ids
+    :param str file_name: name of the uploaded file (the input csv is "<file>_in_<model ids joined by "_">.csv" in the input directory)
+    :param list loaded_models: for every model its model, classes, train configuration and model hash returned by 'load_model' (loaded from the models directory if None)
+    :param int top_k: adds the columns "ethnicity-i" and "probability-i" of the i-th most likely ethnicities (i = 1 ... top_k)
+    :param int chunk_size: amount of names which are classified and appended to the output at once (the whole file at once if None)
+    :param PredictionCache prediction_cache: cache of already classified names (not used if None)
+    :return str: path of the output csv
+    """
+
+    if isinstance(model_ids, str):
+        model_ids = [model_ids]
+
+    # get input and output path
+    csv_in_path = CSV_INPUT_DIRECTORY + file_name.split(".")[0] + "_in_" + "_".join(model_ids) + ".csv"
+    csv_out_path = CSV_OUTPUT_DIRECTORY + file_name.split(".")[0] + "_out_" + "_".join(model_ids) + ".csv" 
+
+    if loaded_models is None:
+        loaded_models = [load_model(model_id) for model_id in model_ids]
+
+    loaded_models = dict(zip(model_ids, loaded_models))
+
+    # stream the file chunk-wise, so the memory usage doesn't grow with the file size
+    chunks = pd.read_csv(csv_in_path, usecols=["names"], chunksize=chunk_size) if chunk_size is not None else [pd.read_csv(csv_in_path, usecols=["names"])]
+
+    # the chunks go into a partial file which only replaces the output once the whole file is classified, a failed chunk doesn't leave a truncated output behind
+    csv_partial_path = csv_out_path + ".partial"
+
+    try:
+        with open(csv_partial_path, "w+") as f:
+            for chunk_idx, chunk in enumerate(chunks):
+                df = classify_names(chunk["names"].tolist(), loaded_models, top_k=top_k, prediction_cache=prediction_cache)
+
+                # only the first chunk writes the header
+                df.to_csv(f, index=False, header=(chunk_idx == 0))
+                f.flush()
+    except BaseException:
+        if os.path.exists(csv_partial_path):
+            os.remove(csv_partial_path)
+        raise
+
+    os.replace(csv_partial_path, csv_out_path)
 
+    # remove temporary csv file
+    os.remove(csv_in_path)
 
+    return csv_out_path
+    
 
+if __name__ == "__main__":
+    # read flag arguments
+    try:
+        parser = argparse.ArgumentParser()
+        parser.add_argument("-i", "--id", required=True, nargs="+")
+        parser.add_argument("-f", "--fileName", required=True)
+        parser.add_argument("-k", "--topK", type=int, default=0)
+        parser.add_argument("-c", "--chunkSize", type=int, default=CSV_CHUNK_SIZE)
+        parser.add_argument("-p", "--predictionCache", default=os.getenv("PREDICTION_CACHE_PATH"))
+        args = vars(parser.parse_args())
+
+        prediction_cache = PredictionCache(args["predictionCache"]) if args["predictionCache"] else None
+        classify_file(args["id"], args["fileName"], top_k=args["topK"], chunk_size=args["chunkSize"], prediction_cache=prediction_cache)
+
+        print("\n-> classified names using the model with id {}.".format(", ".join(args["id"])))
+    except Exception as e:
+        print(traceback.format_exc())
@@ -0,0 +1,174 @@
+""" long-running classification service, keeps recently used models loaded so a request only has to classify its file
+
+    usage: python classify_server.py --port 8090
+    request: POST /classify {"id": "<model id>" or ["<model id>", ...], "fileName": "<uploaded file name>", "topK": <optional amount of top ethnicities>} -> {"output": "<path of the output csv>"}
+"""
+
+import os
+import json
+import argparse
+import threading
+import traceback
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from classify import MODELS_DIRECTORY, load_model, classify_file
+from prediction_cache import PredictionCache
+
+
+class ModelCache:
+    def __init__(self, max_models: int=16):
+        """ least recently used cache of loaded models
+
+        :param int max_models: maximum amount of models which stay loaded
+        """
+
+        self.max_models = max_models
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+
+        # one lock per model which is being loaded, so a model is only loaded once while other models stay available
+        self.loading_locks = {}
+
+    def get(self, model_id: str) -> tuple:
+        """ returns a loaded model (loads it if it isn't cached)
+
+        :param str model_id: id of the model
+        :return tuple: model, classes, train configuration and model hash (see 'classify.load_model')
+        """
+
+        with self.lock:
+            if model_id in self.models:
+                self.models.move_to_end(model_id)
+                return self.models[model_id]
+
+            loading_lock = self.loading_locks.setdefault(model_id, threading.Lock())
+
+        # the cache lock isn't held while loading from disk
+        with loading_lock:
+            with self.lock:
+                if model_id in self.models:
+                    self.models.move_to_end(model_id)
+                    return self.models[model_id]
+
+            loaded_model = load_model(model_id)
+
+            with self.lock:
+                self.models[model_id] = loaded_model
+                self.loading_locks.pop(model_id, None)
+
+                while len(self.models) > self.max_models:
+                    self.models.popitem(last=False)
+
+        return loaded_model
+
+    def preload_standard_models(self) -> list:
+        """ loads the standard models (their ids start with "std_"), models which aren't trained (yet) or fail to load are skipped
+
+        :return list: ids of the loaded models
+        """
+
+        model_ids = sorted([e for e in os.listdir(MODELS_DIRECTORY) if e.startswith("std_") and is_loadable(e)])
+
+        loaded_ids = []
+        for model_id in model_ids[:self.max_models]:
+            try:
+                self.get(model_id)
+                loaded_ids.append(model_id)
+            except Exception:
+                print("-> couldn't preload the model with id {}:".format(model_id))
+                print(traceback.format_exc())
+
+        return loaded_ids
+
+
+def is_loadable(model_id: str) -> bool:
+    """ checks if a model directory contains all files 'classify.load_model' needs
+
+    :param str model_id: id of the model
+    :return bool: true if the model can be loaded
+    """
+
+    model_directory = MODELS_DIRECTORY + model_id + "/"
+
+    if os.path.exists(model_directory + "model_inference.pt"):
+        return True
+
+    return all([os.path.exists(model_directory + file_name) for file_name in ["model.pt", "config.json", "dataset/nationalities.json"]])
+
+
+model_cache = ModelCache(max_models=int(os.getenv("CLASSIFY_CACHE_SIZE", 16)))
+
+# optional sqlite cache of already classified names
+prediction_cache = PredictionCache(os.getenv("PREDICTION_CACHE_PATH"), max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", 1000000))) \
+                   if os.getenv("PREDICTION_CACHE_PATH") else None
+
+
+class ClassificationHandler(BaseHTTPRequestHandler):
+    def _respond(self, status: int, content: dict) -> None:
+        body = json.dumps(content).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path != "/health":
+            self._respond(404, {"error": "unknown path"})
+            return
+
+        self._respond(200, {"loaded-models": list(model_cache.models.keys())})
+
+    def do_POST(self) -> None:
+        if self.path != "/classify":
+            self._respond(404, {"error": "unknown path"})
+            return
+
+        # same inputs as the command line interface of classify.py
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            model_ids, file_name, top_k = request["id"], request["fileName"], int(request.get("topK", 0))
+            model_ids = [model_ids] if isinstance(model_ids, str) else [str(model_id) for model_id in model_ids]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self._respond(400, {"error": "expected a json body with 'id' and 'fileName'"})
+            return
+
+        # model ids and file names become parts of paths, don't allow paths outside of the model and csv directories
+        if "/" in file_name or file_name.startswith("."):
+            self._respond(400, {"error": "invalid file name '{}'".format(file_name)})
+            return
+
+        if len(model_ids) == 0:
+            self._respond(400, {"error": "expected at least one model id"})
+            return
+
+        for model_id in model_ids:
+            if "/" in model_id or model_id.startswith(".") or not is_loadable(model_id):
+                self._respond(404, {"error": "unknown model id '{}'".format(model_id)})
+                return
+
+        try:
+            loaded_models = [model_cache.get(model_id) for model_id in model_ids]
+            csv_out_path = classify_file(model_ids, file_name, loaded_models=loaded_models, top_k=top_k, prediction_cache=prediction_cache)
+        except Exception as e:
+            print(traceback.format_exc())
+            self._respond(500, {"error": str(e)})
+            return
+
+        self._respond(200, {"output": csv_out_path})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-H", "--host", default=os.getenv("CLASSIFY_SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("-p", "--port", type=int, default=int(os.getenv("CLASSIFY_SERVER_PORT", 8090)))
+    args = vars(parser.parse_args())
+
+    preloaded = model_cache.preload_standard_models()
+    print("-> preloaded {} standard models.".format(len(preloaded)))
+
+    server = ThreadingHTTPServer((args["host"], args["port"]), ClassificationHandler)
+    print("-> classification server listening on {}:{}.".format(args["host"], args["port"]))
+    server.serve_forever()
@@ -0,0 +1,140 @@
+""" compact, memory-mapped storage of the raw name corpus """
+
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import argparse
+import numpy as np
+
+
+class NameCorpus:
+    def __init__(self, corpus_path: str=""):
+        """ memory-maps a name corpus created with 'build_corpus'
+
+        :param str corpus_path: path to the corpus directory
+        """
+
+        with open(corpus_path + "/countries.json", "r") as f:
+            meta = json.load(f)
+
+        # hash of the corpus content, changes whenever the corpus is rebuilt from different raw data
+        self.version = meta["version"]
+
+        # country -> (index of first name, index after last name)
+        self.countries = {country: tuple(bounds) for country, bounds in meta["countries"].items()}
+
+        # 'chars' holds the utf-8 bytes of all names, name i is chars[offsets[i]:offsets[i + 1]]
+        self.chars = np.load(corpus_path + "/chars.npy", mmap_mode="r")
+        self.offsets = np.load(corpus_path + "/offsets.npy", mmap_mode="r")
+
+    def __contains__(self, country: str) -> bool:
+        return country in self.countries
+
+    def __iter__(self):
+        return iter(self.countries)
+
+    def __len__(self) -> int:
+        return len(self.countries)
+
+    def count(self, country: str) -> int:
+        """ returns the amount of names of a country """
+
+        start, end = self.countries[country]
+        return end - start
+
+    def get_names(self, country: str, indices: np.ndarray=None) -> list:
+        """ decodes names of a country
+
+        :param str country: country of the names
+        :param np.ndarray indices: indices of the names inside the country (all names if None)
+        :return list: names as strings
+        """
+
+        start, end = self.countries[country]
+
+        if indices is None:
+            offsets = np.asarray(self.offsets[start:(end + 1)])
+            buffer = self.chars[offsets[0]:offsets[-1]].tobytes()
+            offsets = offsets - offsets[0]
+
+            return [buffer[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+        rows = start + np.asarray(indices, dtype=np.int64)
+        starts, ends = self.offsets[rows], self.offsets[rows + 1]
+
+        return [self.chars[s:e].tobytes().decode("utf-8") for s, e in zip(starts, ends)]
+
+
+def build_corpus(raw_dataset_path: str="", corpus_path: str="") -> None:
+    """ converts the raw pickled dict of name lists into the memory-mappable corpus format
+
+    :param str raw_dataset_path: path to the raw dataset pickle (country -> list of names)
+    :param str corpus_path: directory to write the corpus to
+    """
+
+    with open(raw_dataset_path, "rb") as o:
+        raw_dataset = pickle.load(o)
+
+    countries = {}
+    encoded_names = []
+    for country in raw_dataset:
+        start = len(encoded_names)
+        encoded_names += [name.encode("utf-8") for name in raw_dataset[country]]
+        countries[country] = [start, len(encoded_names)]
+
+    del raw_dataset
+
+    lengths = np.fromiter(map(len, encoded_names), dtype=np.int64, count=len(encoded_names))
+    offsets = np.zeros(len(encoded_names) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    chars = np.frombuffer(b"".join(encoded_names), dtype=np.uint8)
+    del encoded_names
+
+    write_corpus(corpus_path, countries, chars, offsets)
+
+
+def write_corpus(corpus_path: str, countries: dict, chars: np.ndarray, offsets: np.ndarray) -> None:
+    """ writes the corpus arrays and the country table
+
+    :param str corpus_path: directory to write the corpus to
+    :param dict countries: country -> [index of first name, index after last name]
+    :param np.ndarray chars: uint8 utf-8 bytes of all names
+    :param np.ndarray offsets: int64 start of every name in 'chars' (plus the end of the last name)
+    """
+
+    version = hashlib.sha256()
+    version.update(json.dumps(countries, sort_keys=True).encode("utf-8"))
+    version.update(offsets.tobytes())
+    version.update(chars.tobytes())
+
+    # write into a temporary directory first, so an interrupted build never leaves a half-written corpus behind
+    tmp_path = corpus_path.rstrip("/") + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    np.save(tmp_path + "/chars.npy", chars)
+    np.save(tmp_path + "/offsets.npy", offsets)
+    with open(tmp_path + "/countries.json", "w+") as f:
+        json.dump({"version": version.hexdigest()[:16], "countries": countries}, f, indent=4)
+
+    if os.path.exists(corpus_path):
+        shutil.rmtree(corpus_path)
+    os.rename(tmp_path, corpus_path)
+
+
+def corpus_exists(corpus_path: str="") -> bool:
+    return os.path.exists(corpus_path + "/countries.json")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--raw", default="dataset/total_names_dataset.pickle")
+    parser.add_argument("-o", "--out", default="dataset/total_names_corpus")
+    args = vars(parser.parse_args())
+
+    build_corpus(raw_dataset_path=args["raw"], corpus_path=args["out"])
+    print("-> built name corpus '{}' from '{}'.".format(args["out"], args["raw"]))
@@ -0,0 +1,115 @@
+""" content-addressed cache of preprocessed datasets, jobs with an already seen class selection skip the preprocessing """
+
+import os
+import json
+import shutil
+import hashlib
+
+
+# files of a job's dataset directory which make up a preprocessed dataset
+DATASET_FILES = ["classes.npy", "names.npy", "offsets.npy", "nationalities.json"]
+
+
+def link_file(source: str, destination: str) -> None:
+    """ hard-links a file (copies it if the file system doesn't support hard-links) """
+
+    if os.path.exists(destination):
+        os.remove(destination)
+
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class DatasetCache:
+    def __init__(self, cache_directory: str="dataset/cache", max_size: int=2048):
+        """ size-bounded cache of preprocessed datasets, the least recently used entries get evicted first
+
+        :param str cache_directory: directory which holds one sub-directory per cached dataset
+        :param int max_size: maximum size of the cache in megabytes
+        """
+
+        self.cache_directory = cache_directory
+        self.max_size = max_size * 1024 ** 2
+
+        if not os.path.exists(self.cache_directory):
+            os.makedirs(self.cache_directory)
+
+    def key(self, classes: list, is_group_level: bool, seed: int, corpus_version: str) -> str:
+        """ computes the canonical key of a class selection
+
+        :param list classes: chosen nationalities or nationality groups (in the order of their class numbers)
+        :param bool is_group_level: true if the classes are nationality groups
+        :param int seed: seed of the name sampling
+        :param str corpus_version: version of the name corpus the dataset is sampled from
+        :return str: cache key
+        """
+
+        selection = {
+            # the order of the classes gives their class numbers, so it's part of the key
+            "classes": list(classes),
+            "is-group-level": bool(is_group_level),
+            "seed": seed,
+            "corpus-version": corpus_version
+        }
+
+        return hashlib.sha256(json.dumps(selection, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+    def fetch(self, key: str, dataset_path: str) -> bool:
+        """ links a cached dataset into a job's dataset directory
+
+        :param str key: cache key
+        :param str dataset_path: dataset directory of the job
+        :return bool: true if the dataset was cached
+        """
+
+        entry = self.cache_directory + "/" + key
+        if not all([os.path.exists(entry + "/" + file_name) for file_name in DATASET_FILES]):
+            return False
+
+        for file_name in DATASET_FILES:
+            link_file(entry + "/" + file_name, dataset_path + "/" + file_name)
+
+        # the modification time of an entry marks its last usage
+        os.utime(entry)
+
+        return True
+
+    def store(self, key: str, dataset_path: str) -> None:
+        """ adds the preprocessed dataset of a job to the cache
+
+        :param str key: cache key
+        :param str dataset_path: dataset directory of the job
+        """
+
+        entry = self.cache_directory + "/" + key
+        tmp_entry = entry + ".tmp"
+
+        if os.path.exists(tmp_entry):
+            shutil.rmtree(tmp_entry)
+        os.mkdir(tmp_entry)
+
+        for file_name in DATASET_FILES:
+            link_file(dataset_path + "/" + file_name, tmp_entry + "/" + file_name)
+
+        if os.path.exists(entry):
+            shutil.rmtree(entry)
+        os.rename(tmp_entry, entry)
+
+        self._evict()
+
+    def _entry_size(self, entry: str) -> int:
+        return sum([os.path.getsize(entry + "/" + file_name) for file_name in os.listdir(entry)])
+
+    def _evict(self) -> None:
+        """ removes the least recently used entries until the cache fits into its maximum size """
+
+        entries = [self.cache_directory + "/" + e for e in os.listdir(self.cache_directory) if not e.endswith(".tmp")]
+        entries = sorted(entries, key=os.path.getmtime)
+
+        total_size = sum([self._entry_size(entry) for entry in entries])
+        while total_size > self.max_size and len(entries) > 0:
+            entry = entries.pop(0)
+            total_size -= self._entry_size(entry)
+            shutil.rmtree(entry)
@@ -0,0 +1,41 @@
+import torch
+import numpy as np
+
+
+class LengthBucketSampler(torch.utils.data.Sampler):
+    def __init__(self, lengths: np.ndarray, batch_size: int=32, bucket_size: int=100, shuffle: bool=True):
+        """ batch sampler which puts names of similar length into the same batch, so batches need less padding
+
+        :param np.ndarray lengths: length of every name in the dataset
+        :param int batch_size: batch-size
+        :param int bucket_size: amount of batches which are sampled together and sorted by length
+        :param bool shuffle: shuffle the names before bucketing and the order of the batches
+        """
+
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.shuffle = shuffle
+
+    def _batches(self) -> list:
+        indices = np.random.permutation(len(self.lengths)) if self.shuffle else np.arange(len(self.lengths))
+
+        batches = []
+        bucket_samples = self.batch_size * self.bucket_size
+        for bucket_start in range(0, len(indices), bucket_samples):
+            bucket = indices[bucket_start:(bucket_start + bucket_samples)]
+
+            # a stable sort keeps the random order between names of the same length
+            bucket = bucket[np.argsort(self.lengths[bucket], kind="stable")]
+            batches += [bucket[i:(i + self.batch_size)].tolist() for i in range(0, len(bucket), self.batch_size)]
+
+        if self.shuffle:
+            batches = [batches[i] for i in np.random.permutation(len(batches))]
+
+        return batches
+
+    def __iter__(self):
+        return iter(self._batches())
+
+    def __len__(self) -> int:
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size
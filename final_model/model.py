@@ -2,11 +2,10 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.nn.utils.rnn import pad_packed_sequence
+from torch.nn.utils.rnn import pad_packed_sequence, pack_padded_sequence
 import numpy as np
 import math
-
-from final_model.utils import device
+from typing import Optional
 
 
 
@@ -40,18 +39,39 @@ class ConvLSTM(nn.Module):
         self.linear1 = nn.Linear(self.hidden_size, class_amount)
         self.logSoftmax = nn.LogSoftmax(dim=1)
 
-    def forward(self, x):
-        x = self.embedder(x.type(torch.LongTensor).to(device=device))
-        x = x.squeeze(2).transpose(1, 2)
+    def forward(self, x, lengths: Optional[torch.Tensor]=None):
+        """ forward pass
+
+        :param torch.Tensor x: padded name indices as long tensor (batch-size x max. length), a trailing dimension of size 1 is accepted as well
+        :param torch.Tensor lengths: length of every name, the LSTM output is taken at the last step of the padded names if not given
+        :return torch.Tensor: log-probabilities of the classes
+        """
+
+        # only convert the input if it isn't already a long tensor on the model's device
+        if x.dim() == 3:
+            x = x.squeeze(2)
+        if x.dtype != torch.long or x.device != self.embedder.weight.device:
+            x = x.to(device=self.embedder.weight.device, dtype=torch.long)
+
+        x = self.embedder(x)
+        x = x.transpose(1, 2)
         
         x = self.conv1(x)
         # x = self.conv2(x)
         # x = self.conv3(x)
         x = x.transpose(1, 2)
 
-        hidden = (torch.zeros(self.layers, x.size(0), self.hidden_size).to(device=device), torch.zeros(self.layers, x.size(0), self.hidden_size).to(device=device))
-        x, _ = self.lstm(x)
-        x = x[:, -1]
+        if lengths is None:
+            x, _ = self.lstm(x)
+            x = x[:, -1]
+        else:
+            # the convolution (without padding) shortens every name by kernel_size - 1 steps
+            lengths = torch.clamp(lengths.cpu() - (self.kernel_size - 1), min=1, max=x.size(1))
+
+            # the LSTM skips the padding of packed sequences, its last hidden state belongs to the last real step of each name
+            packed_x = pack_padded_sequence(x, lengths, batch_first=True, enforce_sorted=False)
+            _, (hidden_states, _) = self.lstm(packed_x)
+            x = hidden_states[-1]
 
         x = self.dropout(x)
 
@@ -4,21 +4,44 @@ import json
 import re
 
 
+def find_split_positions(names: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """ finds the first space of every name
+
+    :param np.ndarray names: concatenated name indices (0-based, the space has index 26)
+    :param np.ndarray offsets: start of every name in 'names' (plus the end of the last name)
+    :return np.ndarray: position of the first space of every name inside 'names', -1 if a name has only one part
+    """
+
+    starts = np.asarray(offsets[:-1], dtype=np.int64)
+    ends = np.asarray(offsets[1:], dtype=np.int64)
+
+    # absolute positions of all spaces inside the names
+    first_char = int(offsets[0])
+    spaces = np.flatnonzero(np.asarray(names[first_char:int(offsets[-1])]) == 26) + first_char
+
+    split_positions = np.full(len(starts), -1, dtype=np.int64)
+    if len(spaces) > 0:
+        first_spaces = spaces[np.minimum(np.searchsorted(spaces, starts), len(spaces) - 1)]
+        has_space = (first_spaces >= starts) & (first_spaces < ends)
+        split_positions[has_space] = first_spaces[has_space]
+
+    return split_positions
+
+
 class NameEthnicityDataset(torch.utils.data.Dataset):
-    def __init__(self, dataset: list=[], class_amount: int=10, augmentation: float=0.0):
+    def __init__(self, dataset: tuple=(), class_amount: int=10, augmentation: float=0.0):
         """ constructor
 
-        :param list dataset: dataset list
+        :param tuple dataset: classes, concatenated name indices and name offsets (the offsets have one more entry than the classes)
         :param int class_amount: amount of classes(/nationalities) in the dataset
         """
 
-        self.dataset = dataset
-        # print(len(self.dataset), len(self.dataset) / 20)
+        self.classes, self.names, self.offsets = dataset
         self.class_amount = class_amount
 
         self.augmentation = augmentation
-        self.seperat_dataset = self.dataset.copy()
-        np.random.shuffle(self.seperat_dataset)
+        if self.augmentation > 0.0:
+            self._build_augmentation_index()
 
     def _preprocess_targets(self, int_representation: int, one_hot: bool=True) -> list:
         """ create one-hot encoding of the target
@@ -37,75 +60,79 @@ class NameEthnicityDataset(torch.utils.data.Dataset):
         else:
             return [int_representation]
 
-    def _name_switch(self, org_name: list, class_: int, chance: float=0.3) -> list:
+    def _build_augmentation_index(self) -> None:
+        """ finds the first space of every name and groups the names which consist of two parts by class """
+
+        self.split_positions = find_split_positions(self.names, self.offsets)
+
+        # class -> indices of all names of that class which have a first- and a surname
+        classes = np.asarray(self.classes)
+        self.augmentation_index = {}
+        for class_ in np.unique(classes):
+            self.augmentation_index[int(class_)] = np.flatnonzero((classes == class_) & (self.split_positions >= 0))
+
+    def _name_switch(self, org_idx: int, class_: int, chance: float=0.3) -> np.ndarray:
         """ switches first and last name part of the name with a random name of the same nationality """
 
+        org_name = self._get_name(org_idx)
+
         augmentation_choice = np.random.uniform(0.0, 1.0)
-        if augmentation_choice <= chance:
+        candidates = self.augmentation_index.get(class_, [])
+        if augmentation_choice > chance or len(candidates) == 0:
+            return org_name
 
-            same_nat_name = []
-            for idx, sample in enumerate(self.seperat_dataset):
-                if class_ == sample[0]:
-                    same_nat_name = [e+1 for e in sample[1]]
-                
-                # some names have only one part for some reason, so don't break the same-nationality search when such appear
-                if 27 in same_nat_name:
-                    self.seperat_dataset.pop(idx)
-                    break
-            
-            org_prename, org_surname = self._split_name(org_name)
-            same_nat_prename, same_nat_surname = self._split_name(same_nat_name)
+        same_nat_idx = candidates[np.random.randint(len(candidates))]
 
-            flip_case = np.random.choice([0, 1])
+        org_prename, org_surname = self._split_name(org_idx)
+        same_nat_prename, same_nat_surname = self._split_name(same_nat_idx)
 
-            if flip_case == 0:
-                return org_prename + [27] + same_nat_surname
+        flip_case = np.random.choice([0, 1])
 
-            elif flip_case == 1:
-                return same_nat_prename + [27] + org_surname
+        if flip_case == 0:
+            return np.concatenate([org_prename, [26], same_nat_surname])
 
-        else:
-            return org_name
+        elif flip_case == 1:
+            return np.concatenate([same_nat_prename, [26], org_surname])
 
-    def _split_name(self, int_name: list) -> list:
-        try:
-            str_index_name = "".join([str(e) + " " for e in int_name])
-            str_index_name_split = str_index_name.split("27", 1)
+    def _split_name(self, idx: int) -> tuple:
+        """ splits a name at its first space
 
-            pre_int_name, sur_int_name = str_index_name_split[0], str_index_name_split[1]
-            pre_int_name = [int(e) for e in pre_int_name.split() if e.isdigit()]
-            sur_int_name = [int(e) for e in sur_int_name.split() if e.isdigit()]
+        :param int idx: index of the name
+        :return np.ndarray, np.ndarray: first- and surname indices (the whole name twice if it has only one part)
+        """
 
-            return pre_int_name, sur_int_name
-            
-        except:
+        split_position = self.split_positions[idx]
+        if split_position < 0:
             # the case, when the name is only one word (no first-/ sur-name)
-            return int_name, int_name
+            name = self._get_name(idx)
+            return name, name
+
+        return self.names[self.offsets[idx]:split_position], self.names[(split_position + 1):self.offsets[idx + 1]]
+
+    def _get_name(self, idx: int) -> np.ndarray:
+        return self.names[self.offsets[idx]:self.offsets[idx + 1]]
 
     def __getitem__(self, idx: int) -> torch.Tensor:
         """ get sample (batch) from dataset
 
         :param int idx: index of dataset (iterator of training-loop)
-        :return tensor: preprocessed sample and target
+        :return tensor: preprocessed sample, target and length of the sample
         """
 
-        sample, target = self.dataset[idx][1], self.dataset[idx][0]
-
-        int_name = [e+1 for e in sample]
+        sample, target = self._get_name(idx), int(self.classes[idx])
 
         if self.augmentation > 0.0:
-            int_name = self._name_switch(int_name, target, chance=self.augmentation)
+            int_name = self._name_switch(idx, target, chance=self.augmentation) + 1
+        else:
+            int_name = sample + 1
 
         target = self._preprocess_targets(target, one_hot=False)
-        
-        # non_padded_batch is the original batch, which is not getting padded so it can be converted back to string
-        non_padded_sample = [e+1 for e in sample]
 
-        return torch.Tensor(int_name), torch.Tensor(target).type(torch.LongTensor), non_padded_sample
+        return torch.as_tensor(int_name, dtype=torch.long), torch.LongTensor(target), len(int_name)
 
     def __len__(self):
         """ returns length of dataset """
         
-        return len(self.dataset)
+        return len(self.classes)
 
 
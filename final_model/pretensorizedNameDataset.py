@@ -0,0 +1,130 @@
+import torch
+import numpy as np
+
+from final_model.nameEthnicityDataset import find_split_positions
+
+
+class PretensorizedNameDataset(torch.utils.data.Dataset):
+    def __init__(self, dataset: tuple=(), class_amount: int=10, augmentation: float=0.0):
+        """ dataset which encodes all names once into a padded tensor, it's indexed with whole batches of indices (use it with a batch-sampler and 'batch_size=None')
+
+        :param tuple dataset: classes, concatenated name indices and name offsets (the offsets have one more entry than the classes)
+        :param int class_amount: amount of classes(/nationalities) in the dataset
+        :param float augmentation: chance of switching the first- or surname of a name with the one of a random name of the same class
+        """
+
+        classes, names, offsets = dataset
+        self.class_amount = class_amount
+        self.augmentation = augmentation
+
+        offsets = np.asarray(offsets, dtype=np.int64)
+        lengths = np.diff(offsets)
+        max_length = int(lengths.max()) if len(lengths) > 0 else 0
+
+        # padded index-representation of all names, indices go from 1 ("a") to 28 ("-"), 0 is the padding
+        padded_names = np.zeros((len(lengths), max_length), dtype=np.uint8)
+        padded_names[np.arange(max_length) < lengths[:, None]] = np.asarray(names[offsets[0]:offsets[-1]]) + 1
+
+        self.names = torch.from_numpy(padded_names)
+        self.lengths = torch.from_numpy(lengths)
+        self.targets = torch.from_numpy(np.asarray(classes, dtype=np.int64) - 1).reshape(-1, 1)
+
+        if self.augmentation > 0.0:
+            self._build_augmentation_index(offsets, find_split_positions(names, offsets))
+
+    def _build_augmentation_index(self, offsets: np.ndarray, split_positions: np.ndarray) -> None:
+        """ groups the names which consist of two parts by class
+
+        :param np.ndarray offsets: start of every name (plus the end of the last name)
+        :param np.ndarray split_positions: absolute position of the first space of every name, -1 if a name has only one part
+        """
+
+        # position of the first space inside the padded rows
+        self.split_positions = torch.from_numpy(np.where(split_positions >= 0, split_positions - offsets[:-1], -1))
+
+        classes = self.targets[:, 0]
+        candidates = torch.nonzero(self.split_positions >= 0).flatten()
+
+        # candidates[candidate_starts[c]:(candidate_starts[c] + candidate_counts[c])] are the two-part names of class c
+        self.candidates = candidates[torch.from_numpy(np.argsort(classes[candidates].numpy(), kind="stable"))]
+        self.candidate_counts = torch.bincount(classes[candidates], minlength=self.class_amount)
+        self.candidate_starts = torch.cumsum(self.candidate_counts, dim=0) - self.candidate_counts
+
+    def _name_switch(self, indices: torch.Tensor, names: torch.Tensor, lengths: torch.Tensor) -> tuple:
+        """ switches first and last name part of the names with random names of the same nationality (batch-wise version of 'NameEthnicityDataset._name_switch')
+
+        :param torch.Tensor indices: indices of the names in the batch
+        :param torch.Tensor names: padded names of the batch
+        :param torch.Tensor lengths: lengths of the names of the batch
+        :return torch.Tensor, torch.Tensor: augmented names and lengths
+        """
+
+        classes = self.targets[indices, 0]
+        augmented = torch.from_numpy(np.random.uniform(0.0, 1.0, size=len(indices)) <= self.augmentation) & (self.candidate_counts[classes] > 0)
+        if not augmented.any():
+            return names, lengths
+
+        rows, classes = indices[augmented], classes[augmented]
+
+        random_picks = torch.from_numpy(np.random.uniform(0.0, 1.0, size=len(rows)))
+        partners = self.candidates[self.candidate_starts[classes] + (random_picks * self.candidate_counts[classes]).long()]
+
+        # first- and surname of the original names (the whole name for both if it has only one part)
+        row_lengths, row_splits = self.lengths[rows], self.split_positions[rows]
+        row_prename_lengths = torch.where(row_splits >= 0, row_splits, row_lengths)
+        row_surname_starts = torch.where(row_splits >= 0, row_splits + 1, torch.zeros_like(row_splits))
+
+        partner_splits = self.split_positions[partners]
+
+        # flip case 0: original first name + partner surname, flip case 1: partner first name + original surname
+        flip_case = torch.from_numpy(np.random.randint(0, 2, size=len(rows))).bool()
+        first_rows = torch.where(flip_case, partners, rows)
+        first_lengths = torch.where(flip_case, partner_splits, row_prename_lengths)
+        second_rows = torch.where(flip_case, rows, partners)
+        second_starts = torch.where(flip_case, row_surname_starts, partner_splits + 1)
+        second_lengths = torch.where(flip_case, row_lengths, self.lengths[partners]) - second_starts
+
+        new_lengths = first_lengths + 1 + second_lengths
+
+        # gather both name parts segment-wise, position j of a new name is copied from (source_rows[j], source_columns[j])
+        positions = torch.arange(int(new_lengths.max())).unsqueeze(0)
+        in_first_part = positions < first_lengths.unsqueeze(1)
+        source_rows = torch.where(in_first_part, first_rows.unsqueeze(1), second_rows.unsqueeze(1))
+        source_columns = torch.where(in_first_part, positions, second_starts.unsqueeze(1) + positions - first_lengths.unsqueeze(1) - 1)
+
+        new_names = self.names[source_rows, source_columns.clamp(0, self.names.size(1) - 1)]
+        new_names[positions == first_lengths.unsqueeze(1)] = 27
+        new_names[positions >= new_lengths.unsqueeze(1)] = 0
+
+        width = max(names.size(1), new_names.size(1))
+        augmented_names = torch.zeros((names.size(0), width), dtype=names.dtype)
+        augmented_names[:, :names.size(1)] = names
+        augmented_names[augmented] = torch.nn.functional.pad(new_names, (0, width - new_names.size(1)))
+
+        lengths = lengths.clone()
+        lengths[augmented] = new_lengths
+
+        return augmented_names, lengths
+
+    def __getitem__(self, indices: list) -> tuple:
+        """ get a whole batch from the dataset
+
+        :param list indices: indices of the batch
+        :return torch.Tensor: padded names as long tensor (batch-size x max. length), targets and lengths of the names
+        """
+
+        indices = torch.as_tensor(indices, dtype=torch.long)
+        names, lengths = self.names[indices], self.lengths[indices]
+
+        if self.augmentation > 0.0:
+            names, lengths = self._name_switch(indices, names, lengths)
+
+        # only pad to the longest name of the batch
+        names = names[:, :int(lengths.max())] if len(indices) > 0 else names
+
+        return names.long(), self.targets[indices], lengths
+
+    def __len__(self):
+        """ returns length of dataset """
+
+        return len(self.targets)
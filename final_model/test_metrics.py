@@ -1,5 +1,6 @@
 
 import numpy as np
+import torch
 import matplotlib.pyplot as plt
 
 # sklearn alternatives:
@@ -39,11 +40,17 @@ def create_confusion_matrix(y_true: list, y_pred: list, classes: list=None, save
     amount_classes = len(classes)
 
     confusion_matrix = np.zeros((amount_classes, amount_classes))
-    for idx in range(len(y_true)):
-        target = y_true[idx]
-        output = y_pred[idx]
+    np.add.at(confusion_matrix, (np.asarray(y_true, dtype=np.int64), np.asarray(y_pred, dtype=np.int64)), 1)
+
+    plot_confusion_matrix(confusion_matrix, classes=classes, save=save)
 
-        confusion_matrix[target][output] += 1
+
+def plot_confusion_matrix(confusion_matrix: np.ndarray, classes: list=None, save: str=None) -> None:
+    """ plots a confusion matrix
+
+    :param np.ndarray confusion_matrix: confusion matrix (rows: targets, columns: predictions)
+    :param list classes: list of class names
+    """
 
     fig, ax = plt.subplots(1)
 
@@ -67,6 +74,60 @@ def create_confusion_matrix(y_true: list, y_pred: list, classes: list=None, save
     plt.show()
 
 
+class MetricsAccumulator:
+    def __init__(self, classes: int=10, device: torch.device=torch.device("cpu")):
+        """ accumulates the confusion matrix of a model batch by batch, so the memory doesn't grow with the size of the evaluated set
+
+        :param int classes: amount of classes
+        :param torch.device device: device of the targets and predictions
+        """
+
+        self.classes = classes
+        self.confusion_matrix = torch.zeros(classes * classes, dtype=torch.long, device=device)
+
+    def update(self, targets: torch.Tensor, predictions: torch.Tensor) -> None:
+        """ adds a batch to the confusion matrix
+
+        :param torch.Tensor targets: targets of the batch (as indices of one-hot enc. vector)
+        :param torch.Tensor predictions: predictions of the batch (as indices of one-hot enc. vector)
+        """
+
+        indices = targets.flatten() * self.classes + predictions.flatten()
+        self.confusion_matrix += torch.bincount(indices, minlength=self.classes * self.classes)
+
+    def matrix(self) -> np.ndarray:
+        """ returns the confusion matrix (rows: targets, columns: predictions) """
+
+        return self.confusion_matrix.reshape(self.classes, self.classes).cpu().numpy()
+
+    def accuracy(self) -> float:
+        """ same result as 'validate_accuracy' """
+
+        matrix = self.matrix()
+        return round((100 * int(np.trace(matrix)) / int(matrix.sum())), 5)
+
+    def precision(self) -> list:
+        """ same result as 'precision' """
+
+        matrix = self.matrix()
+        true_predictions, total_predictions = np.diag(matrix).tolist(), matrix.sum(axis=0).tolist()
+
+        return [round((true_predictions[i] / total_predictions[i]), 5) if total_predictions[i] > 0 else 0 for i in range(self.classes)]
+
+    def recall(self) -> list:
+        """ same result as 'recall' """
+
+        matrix = self.matrix()
+        true_predictions, total_targets = np.diag(matrix).tolist(), matrix.sum(axis=1).tolist()
+
+        return [round((true_predictions[i] / total_targets[i]), 5) if total_targets[i] > 0 else 0 for i in range(self.classes)]
+
+    def f1_score(self) -> list:
+        """ same result as 'f1_score' """
+
+        return f1_score(self.precision(), self.recall())
+
+
 def precision(y_true: list, y_pred: list, classes: int=10) -> list:
     """ calculates recall scores of classes (against all other classes)
 
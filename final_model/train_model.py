@@ -23,6 +23,15 @@ model_config = {
     # batch size
     "batch-size": 512,
 
+    # batch size of the validation and test set (no gradients are stored during the evaluation, so it can be larger)
+    "eval-batch-size": 2048,
+
+    # validate every n epochs (and after the last epoch)
+    "validation-interval": 1,
+
+    # maximum amount of names used for the validation after each epoch (None: the whole validation set)
+    "validation-subset": None,
+
     # initial learning rate
     "init-learning-rate": 0.001,
 
@@ -44,9 +53,33 @@ model_config = {
     # embedding size ("embedding-size" x 1)
     "embedding-size": 200,
 
-    # augmentation chance (name part switching will slow down the training process when set high)
+    # augmentation chance (probability of switching the first- or surname with the one of a random name of the same class)
     "augmentation": 0.2,
 
+    # batch names of similar length together, so less computation is spent on padding
+    "length-bucketing": True,
+
+    # encode the whole dataset once into a padded tensor instead of encoding and padding every name when it's loaded
+    "pretensorized-dataset": True,
+
+    # amount of dataloader worker processes (None: one less than the cpu cores, at most 4)
+    "num-workers": None,
+
+    # amount of batches every dataloader worker loads in advance
+    "prefetch-factor": 2,
+
+    # keep the dataloader workers alive between epochs
+    "persistent-workers": True,
+
+    # load batches into page-locked memory for a faster transfer to the gpu (no effect on cpu)
+    "pin-memory": True,
+
+    # let the LSTM skip the padding of the names (models trained without it read their output at the padded last step)
+    "packed-sequences": True,
+
+    # part of the train batches which are used to estimate the train accuracy (1.0: all batches)
+    "train-accuracy-sample": 1.0,
+
     # when resume is true: replace the first element of "lr-schedule" (the current lr) with the learning rate of the last checkpoint
     "resume": False
 }
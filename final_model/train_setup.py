@@ -3,15 +3,15 @@
 from tqdm import tqdm
 import numpy as np
 import os
+import copy
 import json
-import sklearn.metrics
 import hashlib
 import torch
 import torch.nn as nn
 
 from final_model.model import ConvLSTM as Model
-from final_model.utils import create_dataloader, show_progress, onehot_to_string, init_xavier_weights, device, char_indices_to_string, lr_scheduler, write_json, load_json
-from final_model.test_metrics import validate_accuracy, create_confusion_matrix, recall, precision, f1_score, score_plot
+from final_model.utils import create_dataloader, default_num_workers, show_progress, onehot_to_string, init_xavier_weights, device, char_indices_to_string, lr_scheduler, write_json, load_json
+from final_model.test_metrics import MetricsAccumulator, plot_confusion_matrix, score_plot
 import final_model.xman as xman
 # import wandb
 
@@ -29,9 +29,10 @@ class TrainSetup:
         self.model_name = model_config["model-name"]
         self.job_directory_name = "nec_user_models/" + self.model_name + "/"
         self.model_file = self.job_directory_name + "model.pt"
+        self.inference_model_file = self.job_directory_name + "model_inference.pt"
 
         # dataset parameters
-        self.dataset_path = self.job_directory_name + "dataset/dataset.pickle"
+        self.dataset_path = self.job_directory_name + "dataset"
         self.test_size = model_config["test-size"]
 
         with open(self.job_directory_name + "dataset/nationalities.json", "r") as f: 
@@ -47,6 +48,22 @@ class TrainSetup:
         self.dropout_chance = model_config["dropout-chance"]
         self.embedding_size = model_config["embedding-size"]
         self.augmentation = model_config["augmentation"]
+        self.length_bucketing = model_config.get("length-bucketing", False)
+        self.packed_sequences = model_config.get("packed-sequences", False)
+        self.pretensorized_dataset = model_config.get("pretensorized-dataset", False)
+        self.train_accuracy_sample = model_config.get("train-accuracy-sample", 1.0)
+
+        # dataloader parameters (the batches are only pinned when they are moved to a gpu)
+        self.num_workers = model_config.get("num-workers", None)
+        self.num_workers = default_num_workers() if self.num_workers is None else self.num_workers
+        self.prefetch_factor = model_config.get("prefetch-factor", 2)
+        self.persistent_workers = model_config.get("persistent-workers", False)
+        self.pin_memory = model_config.get("pin-memory", False) and device.type == "cuda"
+
+        # evaluation parameters (batch-size of the validation and test set, validate every n epochs, amount of validation names)
+        self.eval_batch_size = model_config.get("eval-batch-size", self.batch_size)
+        self.validation_interval = model_config.get("validation-interval", 1)
+        self.validation_subset = model_config.get("validation-subset", None)
 
         # unpack learning-rate parameters (idx 0: current lr, idx 1: decay rate, idx 2: decay intervall in iterations)
         self.lr = model_config["lr-schedule"][0]
@@ -61,7 +78,11 @@ class TrainSetup:
 
         # dataloaders for train, test and validation
         self.train_set, self.validation_set, self.test_set = create_dataloader(dataset_path=self.dataset_path, test_size=self.test_size, val_size=self.test_size, \
-                                                                               batch_size=self.batch_size, class_amount=self.total_classes, augmentation=self.augmentation)
+                                                                               batch_size=self.batch_size, class_amount=self.total_classes, augmentation=self.augmentation, \
+                                                                               length_bucketing=self.length_bucketing, eval_batch_size=self.eval_batch_size, \
+                                                                               val_subset=self.validation_subset, pretensorized=self.pretensorized_dataset, \
+                                                                               num_workers=self.num_workers, prefetch_factor=self.prefetch_factor, \
+                                                                               persistent_workers=self.persistent_workers, pin_memory=self.pin_memory)
 
         # resume training boolean
         self.continue_ = model_config["resume"]
@@ -77,50 +98,45 @@ class TrainSetup:
 
         self.silent = silent
 
-    def _validate(self, model, dataset, confusion_matrix: bool=False, plot_scores: bool=False):
+    def _lengths(self, lengths: torch.Tensor) -> torch.Tensor:
+        """ returns the name lengths for the forward pass (None if the model doesn't use packed sequences) """
+
+        return lengths if self.packed_sequences else None
+
+    def _validate(self, model, dataset, confusion_matrix: bool=False, plot_scores: bool=False, eval_device: torch.device=device):
         validation_dataset = dataset
 
         criterion = nn.NLLLoss()
-        losses = []
-        total_targets, total_predictions = [], []
+        total_loss, total_batches = 0.0, 0
+        metrics = MetricsAccumulator(classes=self.total_classes, device=eval_device)
 
-        for names, targets, _ in (tqdm(validation_dataset, desc="validating", ncols=150) if not self.silent else validation_dataset):
-            names = names.to(device=device)
-            targets = targets.to(device=device)
+        # no autograd bookkeeping is needed for the evaluation
+        with torch.inference_mode():
+            model = model.eval()
 
-            predictions = model.eval()(names)
-            loss = criterion(predictions, targets.squeeze())
-            losses.append(loss.item())
+            for names, targets, lengths in (tqdm(validation_dataset, desc="validating", ncols=150) if not self.silent else validation_dataset):
+                names = names.to(device=eval_device, non_blocking=self.pin_memory)
+                targets = targets.to(device=eval_device, non_blocking=self.pin_memory)
 
-            for i in range(predictions.size()[0]):
-                target_index = targets[i].cpu().detach().numpy()[0]
+                predictions = model(names, self._lengths(lengths))
+                loss = criterion(predictions, targets.squeeze(1))
+                total_loss += loss.item()
+                total_batches += 1
 
-                prediction = predictions[i].cpu().detach().numpy()
-                prediction_index = list(prediction).index(max(prediction))
-
-                total_targets.append(target_index)
-                total_predictions.append(prediction_index)
+                metrics.update(targets, predictions.argmax(dim=1))
 
         # calculate loss
-        loss = np.mean(losses)
-
-        # calculate accuracy
-        # accuracy = 100 * sklearn.metrics.accuracy_score(total_targets, total_predictions)
-        accuracy = validate_accuracy(total_targets, total_predictions, threshold=0.4)
+        loss = total_loss / total_batches
 
-        # calculate precision, recall and F1 scores
-        # precision_scores = sklearn.metrics.precision_score(total_targets, total_predictions, average=None)
-        precision_scores = precision(total_targets, total_predictions, classes=self.total_classes)
-
-        # recall_scores = sklearn.metrics.recall_score(total_targets, total_predictions, average=None)
-        recall_scores = recall(total_targets, total_predictions, classes=self.total_classes)
-
-        # f1_scores = sklearn.metrics.f1_score(total_targets, total_predictions, average=None)
-        f1_scores = f1_score(precision_scores, recall_scores)
+        # calculate accuracy, precision, recall and F1 scores (identical to 'validate_accuracy', 'precision', 'recall' and 'f1_score')
+        accuracy = metrics.accuracy()
+        precision_scores = metrics.precision()
+        recall_scores = metrics.recall()
+        f1_scores = metrics.f1_score()
     	
         # create confusion matrix
         if confusion_matrix:
-            create_confusion_matrix(total_targets, total_predictions, classes=list(self.classes.keys()), save="x-manager/" + self.model_name)
+            plot_confusion_matrix(metrics.matrix(), classes=list(self.classes.keys()), save="x-manager/" + self.model_name)
         
         if plot_scores:
             score_plot(precision_scores, recall_scores, f1_scores, list(self.classes.keys()), save="x-manager/" + self.model_name)
@@ -144,16 +160,18 @@ class TrainSetup:
         optimizer = torch.optim.Adam(model.parameters(), lr=self.lr, weight_decay=1e-5)
 
         iterations = 0
+        epoch_val_loss, epoch_val_accuracy = None, None
         for epoch in range(1, (self.epochs + 1)):
 
-            total_train_targets, total_train_predictions = [], []
+            epoch_train_correct, epoch_train_counted = torch.zeros((), dtype=torch.long, device=device), 0
             epoch_train_loss = []
-            for names, targets, _ in (tqdm(self.train_set, desc="epoch", ncols=150) if not self.silent else self.train_set):
+            epoch_characters, epoch_padded_characters = 0, 0
+            for names, targets, lengths in (tqdm(self.train_set, desc="epoch", ncols=150) if not self.silent else self.train_set):
                 optimizer.zero_grad()
 
-                names = names.to(device=device)
-                targets = targets.to(device=device)
-                predictions = model.train()(names)
+                names = names.to(device=device, non_blocking=self.pin_memory)
+                targets = targets.to(device=device, non_blocking=self.pin_memory)
+                predictions = model.train()(names, self._lengths(lengths))
 
                 loss = criterion(predictions, targets.squeeze())
                 loss.backward()
@@ -163,13 +181,15 @@ class TrainSetup:
 
                 # log train loss
                 epoch_train_loss.append(loss.item())
+
+                # count the padding of the batch (index 0 is only used for padding)
+                epoch_padded_characters += (names == 0).sum().item()
+                epoch_characters += names.numel()
                 
-                # log targets and prediction of every iteration to compute the train accuracy later
-                validated_predictions = model.eval()(names)
-                for i in range(validated_predictions.size()[0]): 
-                    total_train_targets.append(targets[i].cpu().detach().numpy()[0])
-                    validated_prediction = validated_predictions[i].cpu().detach().numpy()
-                    total_train_predictions.append(list(validated_prediction).index(max(validated_prediction)))
+                # count the correct predictions of the train step itself (only for a random part of the batches if "train-accuracy-sample" < 1)
+                if self.train_accuracy_sample >= 1.0 or np.random.uniform(0.0, 1.0) < self.train_accuracy_sample:
+                    epoch_train_correct += (predictions.detach().argmax(dim=1) == targets.squeeze(1)).sum()
+                    epoch_train_counted += targets.size(0)
                 
                 iterations += 1
 
@@ -180,14 +200,16 @@ class TrainSetup:
 
             # calculate train loss and accuracy of last epoch
             epoch_train_loss = np.mean(epoch_train_loss)
-            epoch_train_accuracy = 100 * sklearn.metrics.accuracy_score(total_train_targets, total_train_predictions)
+            epoch_train_accuracy = 100 * epoch_train_correct.item() / max(epoch_train_counted, 1)
+            epoch_padding_ratio = 100 * epoch_padded_characters / max(epoch_characters, 1)
 
-            # calculate validation loss and accuracy of last epoch
-            epoch_val_loss, epoch_val_accuracy, _ = self._validate(model, self.validation_set)
+            # calculate validation loss and accuracy of last epoch (every "validation-interval" epochs and after the last one, otherwise the last values are kept)
+            if (epoch - 1) % self.validation_interval == 0 or epoch == self.epochs:
+                epoch_val_loss, epoch_val_accuracy, _ = self._validate(model, self.validation_set)
 
             # print training stats in pretty format
             # if not silent:
-            show_progress(self.epochs, epoch, epoch_train_loss, epoch_train_accuracy, epoch_val_loss, epoch_val_accuracy)
+            show_progress(self.epochs, epoch, epoch_train_loss, epoch_train_accuracy, epoch_val_loss, epoch_val_accuracy, padding_ratio=epoch_padding_ratio)
             # print("\nlr: ", optimizer.param_groups[0]["lr"], "\n")
 
             # save checkpoint of model
@@ -203,6 +225,37 @@ class TrainSetup:
         if not silent:
             self.xmanager.plot_history(save=True)
 
+    def _export_inference_model(self, model) -> float:
+        """ quantizes the LSTM and linear layers of a trained model to int8 and saves it as TorchScript module (with the classes and the config embedded)
+
+        :param model: trained model
+        :return float: test accuracy of the quantized model (None if the export failed)
+        """
+
+        # the inference model is optional, a failed export mustn't lose the trained model
+        try:
+            # dynamic quantization is only supported on the cpu
+            quantized_model = torch.quantization.quantize_dynamic(copy.deepcopy(model).cpu().eval(), {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+            _, quantized_accuracy, _ = self._validate(quantized_model, self.test_set, eval_device=torch.device("cpu"))
+
+            scripted_model = torch.jit.script(quantized_model)
+            torch.jit.save(scripted_model, self.inference_model_file, _extra_files={
+                "nationalities.json": json.dumps(self.classes),
+                "config.json": json.dumps(self.model_config)
+            })
+        except Exception as e:
+            print("\ncouldn't export the inference model!")
+            print(e)
+
+            # don't leave a partially written model behind
+            if os.path.exists(self.inference_model_file):
+                os.remove(self.inference_model_file)
+
+            return None
+
+        return quantized_accuracy
+
     def test(self, print_amount: int=None, plot_confusion_matrix: bool=False, plot_scores: bool=False):
         model = Model(class_amount=self.total_classes, hidden_size=self.hidden_size, layers=self.rnn_layers, dropout_chance=0.0, \
                       embedding_size=self.embedding_size, kernel_size=self.kernel_size, channels=self.channels).to(device=device)
@@ -210,24 +263,26 @@ class TrainSetup:
         model.load_state_dict(torch.load(self.model_file))
 
         _, accuracy, scores = self._validate(model, self.test_set, confusion_matrix=plot_confusion_matrix, plot_scores=plot_scores)
+        quantized_accuracy = self._export_inference_model(model)
 
         if print_amount != None:
             iterations = 0
             break_loops = False
 
-            for names, targets, non_padded_names in tqdm(self.test_set, desc="epoch", ncols=150):
+            for names, targets, lengths in tqdm(self.test_set, desc="epoch", ncols=150):
                 if break_loops:
                     break
 
-                names = names.to(device=device)
-                targets = targets.to(device=device)
+                names = names.to(device=device, non_blocking=self.pin_memory)
+                targets = targets.to(device=device, non_blocking=self.pin_memory)
 
-                predictions = model.eval()(names)
+                with torch.inference_mode():
+                    predictions = model.eval()(names, self._lengths(lengths))
                 predictions, targets, names = predictions.cpu().detach().numpy(), targets.cpu().detach().numpy(), names.cpu().detach().numpy()
 
                 try:
                     for idx in range(len(names)):
-                        names, prediction, target, non_padded_name = names[idx], predictions[idx], targets[idx], non_padded_names[idx]
+                        name, prediction, target, length = names[idx], predictions[idx], targets[idx], lengths[idx]
 
                         # convert to one-hot target
                         amount_classes = prediction.shape[0]
@@ -253,10 +308,10 @@ class TrainSetup:
                         except:
                             predicted_class = "else"
         
-                        names = char_indices_to_string(char_indices=non_padded_name)
+                        name = char_indices_to_string(char_indices=name.flatten()[:int(length)])
     
                         print("\n______________\n")
-                        print("name:", names)
+                        print("name:", name)
         
                         print("predicted as:", predicted_class, "(" + str(certency) + "%)")
                         print("actual target:", target_class)
@@ -277,6 +332,8 @@ class TrainSetup:
         entry["precision-scores"] = precisions
         entry["recall-scores"] = recalls
         entry["f1-scores"] = f1_scores
+        entry["quantized-accuracy"] = quantized_accuracy
+        entry["quantized-accuracy-delta"] = round(quantized_accuracy - accuracy, 5) if quantized_accuracy is not None else None
         write_json(self.job_directory_name + "results.json", entry)
 
         write_json(self.job_directory_name + "config.json", self.model_config)
@@ -6,13 +6,15 @@ import numpy as np
 import torch
 import torch.utils.data
 import torch.nn as nn
-from torch.nn.utils.rnn import pad_sequence, pack_padded_sequence
-import pickle5 as pickle
+from torch.nn.utils.rnn import pad_sequence
+import os
 import time
 import json
 import random
 
 from final_model.nameEthnicityDataset import NameEthnicityDataset
+from final_model.pretensorizedNameDataset import PretensorizedNameDataset
+from final_model.lengthBucketSampler import LengthBucketSampler
 
 torch.manual_seed(0)
 
@@ -22,85 +24,125 @@ device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 def custom_collate(batch):
     """ adds custom dataloader feature: batch padding for the sample-batch (the batch containing the one-hot-enc. names)
 
-    :param batch: three batches -> non-padded sample-batch, target-batch, non-padded sample-batch (again)
-    :return torch.Tensor: padded sample-batch, target-batch, non-padded sample-batch
+    :param batch: three batches -> non-padded sample-batch, target-batch, sample lengths
+    :return torch.Tensor: padded sample-batch (long), target-batch, length-batch
     """
 
-    batch_size = len(batch)
-
-    sample_batch, target_batch, non_padded_batch = [], [], []
-    for sample, target, non_padded_sample in batch:
+    sample_batch, target_batch, length_batch = [], [], []
+    for sample, target, length in batch:
 
         sample_batch.append(sample)
         target_batch.append(target)
 
-        # non_padded_batch is the original batch, which is not getting padded so it can be converted back to string
-        non_padded_batch.append(non_padded_sample)
+        # the lengths are needed to ignore the padding inside the model and to convert the padded names back to strings
+        length_batch.append(length)
 
+    # long index tensor (batch-size x max. length), the model embeds it without any conversion
     padded_batch = pad_sequence(sample_batch, batch_first=True)
 
-    padded_to = list(padded_batch.size())[1]
+    return padded_batch, torch.cat(target_batch, dim=0).reshape(len(sample_batch), target_batch[0].size(0)), torch.LongTensor(length_batch)
+
+
+def default_num_workers() -> int:
+    """ amount of dataloader workers if none is configured (one core stays free for the training loop) """
+
+    return min(4, max((os.cpu_count() or 1) - 1, 0))
+
 
-    padded_batch = padded_batch.reshape(len(sample_batch), padded_to, 1)  
+def seed_worker(worker_id: int) -> None:
+    """ seeds numpy inside a dataloader worker, torch gives every worker its own seed """
 
-    return padded_batch, torch.cat(target_batch, dim=0).reshape(len(sample_batch), target_batch[0].size(0)), non_padded_batch
+    np.random.seed(torch.initial_seed() % 2**32)
 
 
 def create_dataloader(dataset_path: str="", test_size: float=0.01, val_size: float=0.01, batch_size: int=32, class_amount: int=10, \
-                                                                            augmentation: float=0.0):
+                                                                            augmentation: float=0.0, length_bucketing: bool=False, eval_batch_size: int=None, \
+                                                                            val_subset: int=None, pretensorized: bool=False, num_workers: int=0, prefetch_factor: int=2, \
+                                                                            persistent_workers: bool=False, pin_memory: bool=False):
     """ create three dataloader (train, test, validation)
 
-    :param str dataset_path: path to dataset
+    :param str dataset_path: path to the dataset directory (classes.npy, names.npy, offsets.npy)
     :param float test_size/val_size: test-/validation-percentage of dataset
     :param int batch_size: batch-size
+    :param int eval_batch_size: batch-size of the validation and test dataloader (same as 'batch_size' if None)
+    :param int val_subset: maximum amount of validation names (whole validation set if None)
+    :param bool length_bucketing: batch names of similar length together to reduce the padding
+    :param bool pretensorized: encode the whole dataset once into a padded tensor and create the batches by indexing it
+    :param int num_workers: amount of worker processes per dataloader (0: load the batches in the training process)
+    :param int prefetch_factor: amount of batches loaded in advance by every worker
+    :param bool persistent_workers: keep the workers alive between epochs
+    :param bool pin_memory: load the batches into page-locked memory (faster transfer to the gpu)
     :return torch.Dataloader: train-, test- and val-dataloader
     """
 
-    with open(dataset_path, "rb") as f:
-        dataset = pickle.load(f)
-
-    test_size = int(np.round(len(dataset)*test_size))
-    val_size = int(np.round(len(dataset)*val_size))
-
-    train_set, test_set, validation_set = dataset[(test_size+val_size):], dataset[:test_size], dataset[test_size:(test_size+val_size)]
-
-    train_set = NameEthnicityDataset(dataset=train_set, class_amount=class_amount, augmentation=augmentation)
-    test_set = NameEthnicityDataset(dataset=test_set, class_amount=class_amount, augmentation=0.0)
-    val_set = NameEthnicityDataset(dataset=validation_set, class_amount=class_amount, augmentation=0.0)
-
-    train_dataloader = torch.utils.data.DataLoader(
-        train_set,
-        batch_size=batch_size,
-        num_workers=0,
-        shuffle=True,
-        collate_fn=custom_collate
-    )
-    val_dataloader = torch.utils.data.DataLoader(
-        val_set,
-        batch_size=int(batch_size),
-        num_workers=0,
-        shuffle=True,
-        collate_fn=custom_collate
-
-    )
-    test_dataloader = torch.utils.data.DataLoader(
-        test_set,
-        batch_size=int(batch_size),
-        num_workers=0,
-        shuffle=True,
-        collate_fn=custom_collate
-    )
+    # name i consists of the characters names[offsets[i]:offsets[i + 1]] and has the class classes[i]
+    classes = np.load(dataset_path + "/classes.npy", mmap_mode="r")
+    names = np.load(dataset_path + "/names.npy", mmap_mode="r")
+    offsets = np.load(dataset_path + "/offsets.npy", mmap_mode="r")
+
+    test_size = int(np.round(len(classes)*test_size))
+    val_size = int(np.round(len(classes)*val_size))
+
+    # the dataset is shuffled during the preprocessing, so the first names of the validation split are a fixed random subset
+    val_subset_size = val_size if val_subset is None else min(val_size, val_subset)
+
+    # the splits are views on the memory-mapped arrays, nothing gets copied
+    train_set = (classes[(test_size+val_size):], names, offsets[(test_size+val_size):])
+    test_set = (classes[:test_size], names, offsets[:(test_size + 1)])
+    validation_set = (classes[test_size:(test_size+val_subset_size)], names, offsets[test_size:(test_size+val_subset_size + 1)])
+
+    Dataset = PretensorizedNameDataset if pretensorized else NameEthnicityDataset
+    train_lengths, test_lengths, val_lengths = [np.diff(np.asarray(split[2])) for split in [train_set, test_set, validation_set]]
+
+    train_set = Dataset(dataset=train_set, class_amount=class_amount, augmentation=augmentation)
+    test_set = Dataset(dataset=test_set, class_amount=class_amount, augmentation=0.0)
+    val_set = Dataset(dataset=validation_set, class_amount=class_amount, augmentation=0.0)
+
+    eval_batch_size = batch_size if eval_batch_size is None else eval_batch_size
+
+    # the worker options are only accepted by the dataloader when it uses worker processes
+    loader_options = {"num_workers": num_workers, "pin_memory": pin_memory}
+    if num_workers > 0:
+        loader_options.update({"prefetch_factor": prefetch_factor, "persistent_workers": persistent_workers, "worker_init_fn": seed_worker})
+
+    dataloaders = []
+    for dataset, lengths, batch_size in [(train_set, train_lengths, batch_size), (val_set, val_lengths, eval_batch_size), (test_set, test_lengths, eval_batch_size)]:
+        if length_bucketing:
+            batch_sampler = LengthBucketSampler(lengths, batch_size=batch_size, shuffle=True)
+        else:
+            batch_sampler = torch.utils.data.BatchSampler(torch.utils.data.RandomSampler(dataset), batch_size=int(batch_size), drop_last=False)
+
+        if pretensorized:
+            # the dataset returns whole batches, so the batch-sampler is used as the sampler and automatic batching is disabled
+            dataloader = torch.utils.data.DataLoader(
+                dataset,
+                sampler=batch_sampler,
+                batch_size=None,
+                **loader_options
+            )
+        else:
+            dataloader = torch.utils.data.DataLoader(
+                dataset,
+                batch_sampler=batch_sampler,
+                collate_fn=custom_collate,
+                **loader_options
+            )
+
+        dataloaders.append(dataloader)
+
+    train_dataloader, val_dataloader, test_dataloader = dataloaders
 
     return train_dataloader, val_dataloader, test_dataloader
 
 
-def show_progress(epochs: int, epoch: int, train_loss: float, train_accuracy: float, val_loss: float, val_accuracy: float):
+def show_progress(epochs: int, epoch: int, train_loss: float, train_accuracy: float, val_loss: float, val_accuracy: float, padding_ratio: float=None):
     """ print training stats
     
     :param int epochs: amount of total epochs
     :param int epoch: current epoch
     :param float train_loss/train_accuracy: train-loss, train-accuracy
     :param float val_loss/val_accuracy: validation accuracy/loss
+    :param float padding_ratio: percentage of padded characters in the train batches
     :return None
     """
 
@@ -110,7 +152,11 @@ def show_progress(epochs: int, epoch: int, train_loss: float, train_accuracy: fl
     val_accuracy = str(val_accuracy) + "%"
     val_loss = str(val_loss)
     
-    print("epoch {} train_loss: {} - train_acc: {} - val_loss: {} - val_acc: {}".format(epochs, train_loss, train_accuracy, val_loss, val_accuracy), "\n")
+    progress = "epoch {} train_loss: {} - train_acc: {} - val_loss: {} - val_acc: {}".format(epochs, train_loss, train_accuracy, val_loss, val_accuracy)
+    if padding_ratio is not None:
+        progress += " - padding: {}%".format(round(padding_ratio, 2))
+
+    print(progress, "\n")
 
 
 def lr_scheduler(optimizer: torch.optim, current_iteration: int=0, warmup_iterations: int=0, lr_end: float=0.001, decay_rate: float=0.99, decay_intervall: int=100) -> None:
@@ -0,0 +1,138 @@
+""" registry of trained models, jobs which match an already trained model reuse it instead of being trained again """
+
+import os
+import json
+import hashlib
+
+from utils import load_json, write_json
+from dataset_cache import link_file
+from preprocessing import MATCHING_TABLE
+
+
+# files of a job directory which make up a trained model
+MODEL_FILES = ["model.pt", "results.json", "config.json", "dataset/nationalities.json"]
+
+# files which only exist for models trained after they were introduced
+OPTIONAL_MODEL_FILES = ["model_inference.pt"]
+
+# config entries which don't have an influence on the trained model (evaluation and dataloader settings only change the speed and the logged metrics)
+IGNORED_CONFIG_KEYS = ["model-name", "dataset-name", "resume", "eval-batch-size", "validation-interval", "validation-subset", "train-accuracy-sample", \
+                       "pretensorized-dataset", "num-workers", "prefetch-factor", "persistent-workers", "pin-memory"]
+
+NATIONALITY_GROUPS = set(MATCHING_TABLE.values())
+
+# registries written with an older key format are indexed again
+REGISTRY_VERSION = 2
+
+
+def model_key(classes: list, is_group_level: bool, model_config: dict) -> str:
+    """ computes the key of a model from its classes and its train configuration
+
+    :param list classes: nationalities or nationality groups of the model (in the order of their class numbers)
+    :param bool is_group_level: true if the classes are nationality groups
+    :param dict model_config: train configuration
+    :return str: model key
+    """
+
+    config = {key: value for key, value in model_config.items() if key not in IGNORED_CONFIG_KEYS}
+
+    model = {
+        # the order of the classes gives their class numbers (and the order of the scores), so it's part of the key
+        "classes": list(classes),
+        "is-group-level": bool(is_group_level),
+        "config": hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+    }
+
+    return hashlib.sha256(json.dumps(model, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+
+class ModelRegistry:
+    def __init__(self, models_directory: str="nec_user_models"):
+        """ index of all trained models (user and standard models) in the models directory
+
+        :param str models_directory: directory containing one sub-directory per model
+        """
+
+        self.models_directory = models_directory
+        self.registry_file = models_directory + "/registry.json"
+
+    def _model_directory(self, model_id: str) -> str:
+        return self.models_directory + "/" + model_id + "/"
+
+    def _is_complete(self, model_id: str) -> bool:
+        return all([os.path.exists(self._model_directory(model_id) + file_name) for file_name in MODEL_FILES])
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.registry_file):
+            return {}
+
+        registry = load_json(self.registry_file)
+        if registry.get("version") != REGISTRY_VERSION:
+            return {}
+
+        return registry["models"]
+
+    def _write(self, registry: dict) -> None:
+        write_json(self.registry_file, {"version": REGISTRY_VERSION, "models": registry})
+
+    def _sync(self) -> dict:
+        """ adds trained models which aren't indexed yet and removes deleted ones """
+
+        registry = self._load()
+        registry = {model_id: key for model_id, key in registry.items() if self._is_complete(model_id)}
+
+        for model_id in os.listdir(self.models_directory):
+            if model_id in registry or not os.path.isdir(self._model_directory(model_id)) or not self._is_complete(model_id):
+                continue
+
+            # classes in the order of their class numbers
+            class_numbers = load_json(self._model_directory(model_id) + "dataset/nationalities.json")
+            classes = sorted(class_numbers, key=class_numbers.get)
+            model_config = load_json(self._model_directory(model_id) + "config.json")
+
+            # models which weren't registered after training don't store whether they are group-level
+            is_group_level = all([class_ == "else" or class_ in NATIONALITY_GROUPS for class_ in classes])
+
+            registry[model_id] = model_key(classes, is_group_level, model_config)
+
+        self._write(registry)
+
+        return registry
+
+    def find(self, key: str) -> str:
+        """ returns the id of a trained model with the given key (or None if there is none)
+
+        :param str key: model key
+        :return str: model id
+        """
+
+        for model_id, model_key_ in self._sync().items():
+            if model_key_ == key:
+                return model_id
+
+        return None
+
+    def register(self, model_id: str, key: str) -> None:
+        """ adds a just trained model to the registry
+
+        :param str model_id: id of the model
+        :param str key: model key
+        """
+
+        registry = self._load()
+        registry[model_id] = key
+        self._write(registry)
+
+    def reuse(self, model_id: str, job_id: str) -> None:
+        """ links the files of a trained model into the directory of a new job
+
+        :param str model_id: id of the trained model
+        :param str job_id: id of the new job
+        """
+
+        for file_name in MODEL_FILES:
+            link_file(self._model_directory(model_id) + file_name, self._model_directory(job_id) + file_name)
+
+        for file_name in OPTIONAL_MODEL_FILES:
+            if os.path.exists(self._model_directory(model_id) + file_name):
+                link_file(self._model_directory(model_id) + file_name, self._model_directory(job_id) + file_name)
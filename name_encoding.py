@@ -0,0 +1,109 @@
+""" batch normalization and encoding of names, shared by the preprocessing and the classifier """
+
+import re
+import numpy as np
+
+
+# index-representation of the characters, ie: "joe" -> [9, 14, 4]
+ALPHABET = "abcdefghijklmnopqrstuvwxyz -"
+
+# titles that get removed from the beginning of a name
+TITLES = ["dr", "mr", "ms", "miss", "mrs"]
+
+# separates the names when they are processed as one joined string
+_SEPARATOR = "\x00"
+
+_TITLE_PATTERN = re.compile("(?:^|(?<={0}))(?:{1})(?= |{0}|$)".format(_SEPARATOR, "|".join(TITLES)))
+_WHITESPACE_PATTERN = re.compile(r"\s*{}\s*".format(_SEPARATOR))
+
+# byte -> index in ALPHABET, every other byte is marked as invalid
+_INVALID = 255
+_LOOKUP_TABLE = np.full(256, _INVALID, dtype=np.uint8)
+_LOOKUP_TABLE[np.frombuffer(ALPHABET.encode("ascii"), dtype=np.uint8)] = np.arange(len(ALPHABET), dtype=np.uint8)
+
+
+def normalize_names(names: list) -> list:
+    """ lower-cases names, removes leading titles ("dr", "mr", ...) and surrounding whitespace
+
+    :param list names: names (strings)
+    :return list: normalized names
+    """
+
+    if len(names) == 0:
+        return []
+
+    # all names are processed as one string, so every step runs once per batch instead of once per name
+    joined = _SEPARATOR.join(names).lower()
+    joined = _TITLE_PATTERN.sub("", joined)
+    joined = _WHITESPACE_PATTERN.sub(_SEPARATOR, joined).strip()
+
+    normalized = joined.split(_SEPARATOR)
+
+    # a name containing the separator itself would shift all following names, handle that (rare) case one by one
+    if len(normalized) != len(names):
+        normalized = [normalize_names([name.replace(_SEPARATOR, "")])[0] for name in names]
+
+    return normalized
+
+
+def encode_flat(names: list) -> tuple:
+    """ encodes normalized names to alphabet indices, concatenated into one array
+
+    :param list names: normalized names (strings)
+    :return np.ndarray, np.ndarray, np.ndarray: uint8 indices of all names, length of each name, mask of names which only contain valid characters
+    """
+
+    lengths = np.fromiter(map(len, names), dtype=np.int64, count=len(names))
+
+    # non-ascii characters become a single "?" so the byte-offsets stay identical to the string-offsets
+    buffer = np.frombuffer("".join(names).encode("ascii", errors="replace"), dtype=np.uint8)
+    codes = _LOOKUP_TABLE[buffer]
+
+    ends = np.cumsum(lengths)
+    invalid_chars = np.zeros(len(codes) + 1, dtype=np.int64)
+    np.cumsum(codes == _INVALID, out=invalid_chars[1:])
+    valid = ((invalid_chars[ends] - invalid_chars[ends - lengths]) == 0) & (lengths > 0)
+
+    return codes, lengths, valid
+
+
+def encode_names(names: list, index_offset: int=0, dtype: type=np.int64) -> tuple:
+    """ encodes normalized names to a padded index-matrix
+
+    :param list names: normalized names (strings)
+    :param int index_offset: value added to every index (ie. 1 to keep 0 free for padding)
+    :param type dtype: dtype of the index-matrix
+    :return np.ndarray, np.ndarray, np.ndarray: index-matrix (amount names x longest name, padded with 0), length of each name, mask of valid names
+    """
+
+    codes, lengths, valid = encode_flat(names)
+
+    max_length = int(lengths.max()) if len(lengths) > 0 else 0
+    padded = np.zeros((len(names), max_length), dtype=dtype)
+
+    # the row-major order of the mask matches the order of the concatenated indices
+    padded[np.arange(max_length) < lengths[:, None]] = codes.astype(dtype) + index_offset
+
+    return padded, lengths, valid
+
+
+def gather_names(codes: np.ndarray, lengths: np.ndarray, indices: np.ndarray) -> tuple:
+    """ selects (and reorders) names of concatenated name indices without splitting them
+
+    :param np.ndarray codes: concatenated indices of all names
+    :param np.ndarray lengths: length of each name
+    :param np.ndarray indices: indices of the names to select
+    :return np.ndarray, np.ndarray: concatenated indices and lengths of the selected names
+    """
+
+    starts = np.zeros(len(lengths), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+
+    selected_lengths = lengths[indices]
+    selected_starts = np.zeros(len(selected_lengths), dtype=np.int64)
+    np.cumsum(selected_lengths[:-1], out=selected_starts[1:])
+
+    # position of every selected character inside 'codes'
+    positions = np.arange(selected_lengths.sum()) + np.repeat(starts[indices] - selected_starts, selected_lengths)
+
+    return codes[positions], selected_lengths
@@ -0,0 +1,100 @@
+""" persistent cache of the class probabilities of already classified names, shared by all models
+
+    only models trained on packed sequences are cached, the prediction of a name doesn't depend on the rest of its batch for them.
+    the int8 inference models still drift slightly (in the order of 1e-4) between batches, since dynamic quantization scales the activations per batch,
+    so a cached probability can differ from a fresh one in the last digits.
+"""
+
+import time
+import hashlib
+import sqlite3
+import numpy as np
+
+
+# sqlite limits the amount of variables per statement
+_QUERY_CHUNK_SIZE = 500
+
+
+def model_hash(model_bytes: bytes) -> str:
+    """ hashes the content of a model file, the cached predictions of a model become invalid once it's retrained
+
+    :param bytes model_bytes: content of the model file
+    :return str: hash of the model file
+    """
+
+    return hashlib.sha256(model_bytes).hexdigest()[:16]
+
+
+class PredictionCache:
+    def __init__(self, cache_path: str="", max_entries: int=1000000):
+        """ sqlite cache of normalized name -> class probabilities, per (model id, model file hash)
+
+        :param str cache_path: path to the sqlite database (created if it doesn't exist)
+        :param int max_entries: maximum amount of cached names of all models, the least recently used ones are evicted first
+        """
+
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS predictions (model TEXT, name TEXT, probabilities BLOB, last_used REAL, PRIMARY KEY (model, name)) WITHOUT ROWID")
+            connection.execute("CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)")
+        connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # a connection per call, so the cache can be used from several threads and processes at once
+        connection = sqlite3.connect(self.cache_path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+
+        return connection
+
+    def get(self, model_key: str, names: list, class_amount: int) -> dict:
+        """ looks up cached names
+
+        :param str model_key: model id and model file hash (see 'model_hash')
+        :param list names: normalized names
+        :param int class_amount: amount of classes of the model
+        :return dict: name -> float32 probabilities of the classes, only for the cached names
+        """
+
+        cached = {}
+
+        with self._connect() as connection:
+            for start in range(0, len(names), _QUERY_CHUNK_SIZE):
+                chunk = list(names[start:(start + _QUERY_CHUNK_SIZE)])
+                rows = connection.execute("SELECT name, probabilities FROM predictions WHERE model = ? AND name IN ({})".format(", ".join(["?"] * len(chunk))), [model_key] + chunk)
+
+                for name, probabilities in rows:
+                    probabilities = np.frombuffer(probabilities, dtype=np.float32)
+                    if len(probabilities) == class_amount:
+                        cached[name] = probabilities
+
+            # mark the hits as recently used
+            now = time.time()
+            connection.executemany("UPDATE predictions SET last_used = ? WHERE model = ? AND name = ?", [(now, model_key, name) for name in cached])
+        connection.close()
+
+        return cached
+
+    def put(self, model_key: str, names: list, probabilities: np.ndarray) -> None:
+        """ caches the predictions of names and evicts the least recently used names if the cache is full
+
+        :param str model_key: model id and model file hash (see 'model_hash')
+        :param list names: normalized names
+        :param np.ndarray probabilities: probabilities of the classes (amount names x amount classes)
+        """
+
+        if len(names) == 0:
+            return
+
+        now = time.time()
+        probabilities = np.ascontiguousarray(probabilities, dtype=np.float32)
+
+        with self._connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)", \
+                                   [(model_key, name, row.tobytes(), now) for name, row in zip(names, probabilities)])
+
+            overflow = connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                connection.execute("DELETE FROM predictions WHERE (model, name) IN (SELECT model, name FROM predictions ORDER BY last_used LIMIT ?)", (overflow,))
+        connection.close()
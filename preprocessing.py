@@ -1,10 +1,10 @@
-import pickle
-import random
 import os
 import json
-from tqdm import tqdm
-import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
+from corpus import NameCorpus
+from name_encoding import normalize_names, encode_flat, gather_names
 
 ALL_NATIONALITIES = ['british', 'indian', 'american', 'german', 'polish', 'pakistani', 'italian', 'romanian', 'french', 'chinese', 'irish', 'japanese', 'spanish', 'filipino', 'dutch', 'nigerian', 'south korean', 'taiwanese', 'hong konger','korean', 'swiss', 'danish', 'austrian','belgian', 'luxembourger', 'portugese',
                         'norwegian', 'swedish', 'finnish', 'icelandic', 'denmark', 'lithuanian', 'estonian', 'latvian', 'hungarian', 'bulgarian', 'czech', 'albanian', 'slovak', 'slovenian', 'algerian', 'croatian', 'serbian', 'macedonian', 'georgian', 'citizen of bosnia and herzegovina', 'kosovan', 'belarusian',
@@ -19,11 +19,9 @@ ALL_NATIONALITIES = ['british', 'indian', 'american', 'german', 'polish', 'pakis
 MATCHING_TABLE = {"nigerian": "african", "south african": "african", "namibian": "african", "zimbabwean": "african", "ghanian": "african", "egyptian": "african", "kenyan": "african", "mauritian": "african", "ugandan": "african", "cameroonian": "african", "zambian": "african", "congolese": "african", "sierra leonean": "african", "sudanese": "african", "tanzanian": "african", "somali": "african", "malawian": "african", "gambian": "african", "british": "angloAmerican", "irish": "angloAmerican", "american": "angloAmerican", "australian": "angloAmerican", "canadian": "angloAmerican", "new zealander": "angloAmerican", "maltese": "angloAmerican", "british virgin islander": "angloAmerican", "chinese": "eastAsian", "malaysian": "eastAsian", "japanese": "eastAsian", "vietnamese": "eastAsian", "thai": "eastAsian", "korean": "eastAsian", "south korean": "eastAsian", "hong konger": "eastAsian", "taiwanese": "eastAsian", "indonesian": "eastAsian", "polish": "european", "romanian": "european", "italian": "european", "french": "european", "german": "european", "bulgarian": "european", "lithuanian": "european", "dutch": "european", "hungarian": "european", "greek": "european", "latvian": "european", "russian": "european", "belgian": "european", "ukrainian": "european", "slovak": "european", "czech": "european", "swiss": "european", "austrian": "european", "cypriot": "european", "albanian": "european", "estonian": "european", "croatian": "european", "slovenian": "european", "belarusian": "european", "serbian": "european", "moldovan": "european", "kosovan": "european", "filipino": "hispanic", "spanish": "hispanic", "portugese": "hispanic", "brazilian": "hispanic", "mexican": "hispanic", "colombian": "hispanic", "venezuelan": "hispanic", "argentine": "hispanic", "israeli": "Jewish", "pakistani": "arabic", "turkish": "arabic", "bangladeshi": "arabic", "iranian": "arabic", "afghan": "arabic", "iraqi": "arabic", "moroccan": "arabic", "syrian": "arabic", "lebanese": "arabic", "saudi arabian": "arabic", "algerian": "arabic", "jordanian": "arabic", "uzbek": "arabic", "libyan": "arabic", "kazakh": "arabic", "azerbaijani": "arabic", "luxembourger": "european", "georgian": "arabic", "kuwaiti": "arabic", "tunisian": "arabic", "sri lankan": "None", "jamaican": "None", "trinidadian": "None", "swedish": "scandinavian", "denmark": "scandinavian" , "danish": "scandinavian", "norwegian": "scandinavian", "finnish": "scandinavian", "icelandic": "scandinavian", "indian": "southAsian", "singaporean": "southAsian", "nepalese": "southAsian"}
 
 
-def get_matrix_from_name(name: str, abc_dict: list):
-    matrix = []
-    for letter in name:
-        matrix.append(abc_dict[letter])
-    return matrix
+# countries with this amount of names or less are left out
+MINIMUM_PER_COUNTRY = 1
+
 
 def get_name_from_matrix(matrix: list, abc_list: list):
     name = ""
@@ -33,257 +31,194 @@ def get_name_from_matrix(matrix: list, abc_list: list):
         name += letter
     return name
 
-def handle_clusters(nationality: str, dict_clusters: dict):
-    for key in dict_clusters:
-        if nationality in dict_clusters[key]:
-            return key
-    return "other"
-
-def max_per_cluster(cluster_dict: dict, amount_names_country: dict):
-    max_per_cluster = {}
-    for key in cluster_dict:
-
-        smallest = 1e10
-        for country in cluster_dict[key]:
-
-            if country in amount_names_country:
-                if amount_names_country[country] <= smallest:
-                    smallest = amount_names_country[country]
-
-        for country in cluster_dict[key]:
-            max_per_cluster[country] = smallest
-
-    return max_per_cluster
-
-
-def preprocess_nationalities(job_id: str="", nationalities: str="", raw_dataset_path: str=""):
-    # load raw dataset
-    with open(raw_dataset_path, "rb") as o:
-        dict_chosen_names = pickle.load(o)
-
-    # set lower limit of names per country if wanted
-    minimum_per_country = 1
-
-    # abc_dict is a dictionary where the letters "a"-"z" and " " and "-" are keys to lists representing these values in the matrix_name_list
-    abc_dict = {}
-    abc_list = ["a","b","c","d","e","f","g","h","i","j","k","l","m","n","o","p","q","r","s","t","u","v","w","x","y","z"," ","-"]
-    a = list(range(len(abc_list)))
-    for i in range(len(abc_list)):
-        abc_dict[abc_list[i]] = a[i]
-
-    # get name amount per country
-    amount_names_chountry = {}
-    dict_chosen_names_2 = dict_chosen_names.copy()
-    for key in dict_chosen_names_2:
-
-        if len(dict_chosen_names[key]) <= minimum_per_country:
-            dict_chosen_names.pop(key)
-        else:
-            amount_names_chountry[key]= len(dict_chosen_names[key])
-    
-    chosen_nationalities_dict = {}
-    available_nationalities = ALL_NATIONALITIES.copy()
-    for nationality in nationalities:
-        if nationality == "else":
-            continue
-
-        chosen_nationalities_dict[nationality] = [nationality]
-        available_nationalities.pop(available_nationalities.index(nationality))
-        
+
+def nationality_class_mapping(nationalities: list) -> dict:
+    """ maps every country to its class when training on single nationalities, "else" collects all nationalities which weren't chosen """
+
+    class_mapping = {nationality: nationality for nationality in nationalities if nationality != "else"}
+
     if "else" in nationalities:
-        chosen_nationalities_dict["else"] = available_nationalities
-
-    # gather equally distributed names of all chosen countries
-    max_per_cluster_dict = max_per_cluster(chosen_nationalities_dict, amount_names_chountry)
-    matrix_name_dict = {}
-    nationality_to_number_dict = {}
-    number = 0
-
-    for key in dict_chosen_names:
-        try:
-
-            max_nat = max_per_cluster_dict[key]
-            counter = 0
-
-            list_of_names = dict_chosen_names[key]
-            random.shuffle(list_of_names)
-
-            all_names = []
-            for name in list_of_names:
-                name = name.lower()
-
-                # remove "dr", "ms", "mr", "mrs"
-                if name.split(" ")[0] == "dr" or name.split(" ")[0] == "mr" or name.split(" ")[0] == "ms" or name.split(" ")[0] == "miss" or name.split(" ")[0] == "mrs":
-                    space_idx = name.strip().index(" ")
-                    name = name[space_idx:]
-
-                # remove random spaces before name
-                if list(name)[0] == " ":
-                    name = name[1:]
-
-                if counter <= max_nat:
-                    name = name.strip()
-                    nationality = key
-
-                    org_nat = nationality
-                    nationality = handle_clusters(nationality, chosen_nationalities_dict)
-
-                    if nationality not in nationality_to_number_dict and nationality != 'other':
-                        nationality_to_number_dict[nationality] = number
-                        number += 1
-                        matrix_name_dict[nationality_to_number_dict[nationality]]=[get_matrix_from_name(name, abc_dict)]
-                    elif nationality in nationality_to_number_dict and nationality != 'other':
-                        matrix_name_dict[nationality_to_number_dict[nationality]]+=[get_matrix_from_name(name, abc_dict)]       
-                    counter += 1
-                else:
-                    name = name.strip()
-                    nationality = key
-                    org_nat = nationality
-                    nationality = handle_clusters(nationality, chosen_nationalities_dict)
-
-                    if nationality not in nationality_to_number_dict and nationality!= 'other':
-                        nationality_to_number_dict[nationality]= number
-                        number += 1
-                        matrix_name_dict[nationality_to_number_dict[nationality]]=[get_matrix_from_name(name, abc_dict)]
-                    elif nationality in nationality_to_number_dict and nationality!= 'other':
-                            matrix_name_dict[nationality_to_number_dict[nationality]]+=[get_matrix_from_name(name, abc_dict)]
-        except:
-            pass
-
-    matrix_name_list = []
-    nr_of_countries = 0
-    list_countries_used = []
-
-    minimum_per_country = min([len(matrix_name_dict[country]) for country in matrix_name_dict])
-    for country in matrix_name_dict:
-
-        if len(matrix_name_dict[country]) >= minimum_per_country:
-            list_countries_used += [country]
-            nr_of_countries += 1
-            names = matrix_name_dict[country]
-            random.shuffle(names)
-            names = names[:minimum_per_country]
-
-            for name in names:
-                matrix_name_list += [[nr_of_countries, name]]
-
-    random.shuffle(matrix_name_list)
+        class_mapping.update({nationality: "else" for nationality in ALL_NATIONALITIES if nationality not in class_mapping})
 
-    """ SAVE DATASET FILES """
+    return class_mapping
 
-    dataset_path = "nec_user_models/" + job_id + "/dataset"
-    if not os.path.exists(dataset_path):
-        os.mkdir(dataset_path)
+def group_class_mapping(groups: list) -> dict:
+    """ maps every country to its class when training on nationality groups, "else" collects all nationalities outside of the chosen groups """
 
-    with open(dataset_path + "/dataset.pickle", "wb+") as o:
-        pickle.dump(matrix_name_list, o, pickle.HIGHEST_PROTOCOL)
+    class_mapping = {country: group for country, group in MATCHING_TABLE.items() if group in groups and group != "else"}
 
-    names_countries_used = {}
-    for i, element in enumerate(list_countries_used):
-        country_name = list(nationality_to_number_dict.keys())[list(nationality_to_number_dict.values()).index(element)]
-        names_countries_used[country_name] = i
+    if "else" in groups:
+        class_mapping.update({nationality: "else" for nationality in ALL_NATIONALITIES if nationality not in class_mapping})
 
-    filepath = dataset_path + "/nationalities.json"
-    with open(filepath, 'w+') as f:
-        json.dump(names_countries_used, f, indent=4)
+    return class_mapping
 
 
+def balance_smallest_class(class_sizes: dict) -> dict:
+    """ balancing policy: every class gets as many names as the smallest class has """
 
+    quota = min(class_sizes.values())
+    return {class_: quota for class_ in class_sizes}
 
-def preprocess_groups(job_id: str="", groups: str="", raw_dataset_path: str=""):
-    # load raw dataset
-    with open(raw_dataset_path, "rb") as o:
-        dict_chosen_names = pickle.load(o)
+def balance_none(class_sizes: dict) -> dict:
+    """ balancing policy: every class keeps all of its names """
 
-    # set lower limit of names per country if wanted
-    minimum_per_country = 1
+    return dict(class_sizes)
 
-    # abc_dict is a dictionary where the letters "a"-"z" and " " and "-" are keys to lists representing these values in the matrix_name_list
-    abc_dict = {}
-    abc_list = ["a","b","c","d","e","f","g","h","i","j","k","l","m","n","o","p","q","r","s","t","u","v","w","x","y","z"," ","-"]
-    a = list(range(len(abc_list)))
-    for i in range(len(abc_list)):
-        abc_dict[abc_list[i]] = a[i]
 
+def sample_country_amounts(country_sizes: dict, quota: int, rng: np.random.Generator) -> dict:
+    """ spreads the quota of a class randomly over its countries (like drawing from the union of their names) """
 
-    nationalities = []
-    for nationality in ALL_NATIONALITIES:
-        if nationality in MATCHING_TABLE and MATCHING_TABLE[nationality] in groups:
-            nationalities.append(nationality)
+    countries = list(country_sizes.keys())
+    per_country = rng.multivariate_hypergeometric([country_sizes[country] for country in countries], quota)
 
-    if "else" in groups:
-        nationalities.append("else")
+    return {country: int(amount) for country, amount in zip(countries, per_country) if amount > 0}
 
-    chosen_nationalities = []
-    available_nationalities = ALL_NATIONALITIES.copy()
-    for nationality in nationalities:
-        if nationality == "else":
-            continue
+def preprocessing_workers() -> int:
+    """ amount of preprocessing processes, set with the 'PREPROCESSING_WORKERS' environment variable (default: all cores) """
 
-        chosen_nationalities.append(nationality)
-        available_nationalities.pop(available_nationalities.index(nationality))
-    
-    if "else" in nationalities:
-        chosen_nationalities.append("else")
-        else_ = available_nationalities
-    else:
-        else_ = []
-    
-    group_names = [[] for _ in range(len(groups))]
-
-    for country in dict_chosen_names:
-        if country in MATCHING_TABLE and MATCHING_TABLE[country] in groups:
-            group = MATCHING_TABLE[country]
-        elif country in else_:
-            group = "else"
-        else:
-            continue
-
-        class_ = groups.index(group)
-        for name in dict_chosen_names[country]:
-            try:
-                name = name.lower()
-
-                # remove "dr", "ms", "mr", "mrs"
-                if name.split(" ")[0] == "dr" or name.split(" ")[0] == "mr" or name.split(" ")[0] == "ms" or name.split(" ")[0] == "miss" or name.split(" ")[0] == "mrs":
-                    space_idx = name.strip().index(" ")
-                    name = name[space_idx:]
-
-                # remove random spaces before name
-                if list(name)[0] == " ":
-                    name = name[1:]
-
-                name = name.strip()
-                int_name = get_matrix_from_name(name, abc_dict)
-                group_names[class_].append([class_ + 1, int_name])
-            except Exception as e:
-                pass
-
-    maximum_names = len(group_names[0])
-    for idx, group in enumerate(group_names[1:]):
-        if len(group) < maximum_names:
-            maximum_names = len(group)
-
-    dataset = []
-    for group in group_names:
-        names = group.copy()
-        random.shuffle(names)
-        dataset += names[:maximum_names]
-        
-    random.shuffle(dataset)
+    return int(os.getenv("PREPROCESSING_WORKERS", os.cpu_count() or 1))
+
+# every worker process memory-maps the corpus once
+_worker_corpora = {}
+
+def _encode_country(task: tuple) -> tuple:
+    """ samples, cleans and encodes the names of one country (runs inside the worker processes) """
+
+    corpus_path, country, amount, seed = task
+
+    if corpus_path not in _worker_corpora:
+        _worker_corpora[corpus_path] = NameCorpus(corpus_path)
+    corpus = _worker_corpora[corpus_path]
+
+    indices = np.random.default_rng(seed).choice(corpus.count(country), size=amount, replace=False)
+    codes, lengths, valid = encode_flat(normalize_names(corpus.get_names(country, indices)))
+
+    # drop names with characters which aren't in the alphabet
+    return codes[np.repeat(valid, lengths)], lengths[valid]
+
+def encode_countries(corpus_path: str, tasks: list, rng: np.random.Generator, workers: int=1) -> list:
+    """ runs '_encode_country' for every (country, amount) task, in parallel if more than one worker is used
+
+    :param str corpus_path: path to the name corpus
+    :param list tasks: list of (country, amount of names to sample)
+    :param np.random.Generator rng: generator to draw the seeds of the tasks from
+    :param int workers: amount of worker processes
+    :return list: concatenated indices and lengths of the encoded names of every task (in the order of the tasks)
+    """
+
+    # every task gets its own seed, so the result doesn't depend on the amount of workers
+    seeds = rng.integers(0, 2**32, size=len(tasks))
+    tasks = [(corpus_path, country, amount, seed) for (country, amount), seed in zip(tasks, seeds)]
+
+    if workers <= 1 or len(tasks) <= 1:
+        return [_encode_country(task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        return list(executor.map(_encode_country, tasks))
+
+
+def build_dataset(class_names: list, class_quotas: list, rng: np.random.Generator) -> tuple:
+    """ randomly cuts every class to its quota and shuffles the dataset
+
+    :param list class_names: for every class a list of (concatenated indices, lengths) chunks of its encoded names
+    :param list class_quotas: amount of names to keep of every class
+    :param np.random.Generator rng: random generator
+    :return np.ndarray: classes (starting at 1), concatenated name indices and lengths of the dataset
+    """
+
+    classes, codes, lengths = [], [], []
+    for class_, (chunks, quota) in enumerate(zip(class_names, class_quotas)):
+        class_codes = np.concatenate([chunk[0] for chunk in chunks] + [np.zeros(0, dtype=np.uint8)])
+        class_lengths = np.concatenate([chunk[1] for chunk in chunks] + [np.zeros(0, dtype=np.int64)])
+
+        chosen = rng.permutation(len(class_lengths))[:quota]
+        chosen_codes, chosen_lengths = gather_names(class_codes, class_lengths, chosen)
+
+        classes.append(np.full(len(chosen), class_ + 1, dtype=np.uint8))
+        codes.append(chosen_codes)
+        lengths.append(chosen_lengths)
+
+    classes, codes, lengths = np.concatenate(classes), np.concatenate(codes), np.concatenate(lengths)
+
+    order = rng.permutation(len(classes))
+    codes, lengths = gather_names(codes, lengths, order)
+
+    return classes[order], codes, lengths
+
+def write_dataset(dataset_path: str, classes: np.ndarray, codes: np.ndarray, lengths: np.ndarray) -> None:
+    """ saves a dataset as memory-mappable arrays: uint8 classes, uint8 concatenated name indices and int32 name offsets """
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+
+    np.save(dataset_path + "/classes.npy", classes.astype(np.uint8))
+    np.save(dataset_path + "/names.npy", codes.astype(np.uint8))
+    np.save(dataset_path + "/offsets.npy", offsets)
+
+
+def preprocess(job_id: str="", classes: list=[], class_mapping: dict={}, corpus_path: str="", seed: int=None, workers: int=None, balancing=balance_smallest_class):
+    """ samples, cleans and encodes the dataset of a job and saves it to its dataset directory
+
+    :param str job_id: id of the job
+    :param list classes: classes of the model (their order gives the class numbers)
+    :param dict class_mapping: country -> class, countries which aren't in the mapping are left out
+    :param str corpus_path: path to the name corpus
+    :param int seed: seed of the sampling
+    :param int workers: amount of worker processes (default: 'PREPROCESSING_WORKERS' environment variable)
+    :param balancing: policy which maps the amount of available names of every class to the amount of names to use
+    """
+
+    # memory-map the raw name corpus
+    corpus = NameCorpus(corpus_path)
+    rng = np.random.default_rng(seed)
+    workers = preprocessing_workers() if workers is None else workers
+
+    # one pass over the corpus to get the amount of names of every country per class
+    country_sizes = {class_: {} for class_ in classes}
+    for country in corpus:
+        class_ = class_mapping.get(country)
+        if class_ is not None and corpus.count(country) > MINIMUM_PER_COUNTRY:
+            country_sizes[class_][country] = corpus.count(country)
+
+    # classes without any names can't be trained on and are left out
+    class_sizes = {class_: sum(country_sizes[class_].values()) for class_ in classes if len(country_sizes[class_]) > 0}
+
+    # work out how many names every class gets before touching any name, then only clean and encode the drawn ones
+    class_quotas = balancing(class_sizes)
+
+    tasks, task_classes = [], []
+    for class_, quota in class_quotas.items():
+        for country, amount in sample_country_amounts(country_sizes[class_], quota, rng).items():
+            tasks.append((country, amount))
+            task_classes.append(class_)
+
+    class_names = {class_: [] for class_ in class_quotas}
+    for class_, encoded_names in zip(task_classes, encode_countries(corpus_path, tasks, rng, workers)):
+        class_names[class_].append(encoded_names)
+
+    # names that couldn't be encoded were dropped, so apply the balancing again to even out the classes
+    kept_quotas = balancing({class_: sum([len(chunk[1]) for chunk in chunks]) for class_, chunks in class_names.items()})
+    dataset_classes, codes, lengths = build_dataset(list(class_names.values()), list(kept_quotas.values()), rng)
+
+    """ SAVE DATASET FILES """
 
     dataset_path = "nec_user_models/" + job_id + "/dataset"
     if not os.path.exists(dataset_path):
         os.mkdir(dataset_path)
 
-    with open(dataset_path + "/dataset.pickle", "wb+") as o:
-        pickle.dump(dataset, o, pickle.HIGHEST_PROTOCOL)
+    write_dataset(dataset_path, dataset_classes, codes, lengths)
+
+    with open(dataset_path + "/nationalities.json", "w+") as f:
+        json.dump({class_: idx for idx, class_ in enumerate(class_names)}, f, indent=4)
+
+
+def preprocess_nationalities(job_id: str="", nationalities: list=[], corpus_path: str="", seed: int=None, workers: int=None):
+    preprocess(job_id=job_id, classes=nationalities, class_mapping=nationality_class_mapping(nationalities), corpus_path=corpus_path, seed=seed, workers=workers)
 
-    classes = {k: v for v, k in enumerate(groups)}
 
-    filepath = dataset_path + "/nationalities.json"
-    with open(filepath, 'w+') as f:
-        json.dump(classes, f, indent=4)
+def preprocess_groups(job_id: str="", groups: list=[], corpus_path: str="", seed: int=None, workers: int=None):
+    preprocess(job_id=job_id, classes=groups, class_mapping=group_class_mapping(groups), corpus_path=corpus_path, seed=seed, workers=workers)
 
 
-# preprocess_nationalities(job_id="10_nationalities_and_else", nationalities=["british", "german", "chinese", "dutch", "japanese", "indian", "spanish", "italian", "russian", "else"], raw_dataset_path="dataset/total_names_dataset.pickle")
+# preprocess_nationalities(job_id="10_nationalities_and_else", nationalities=["british", "german", "chinese", "dutch", "japanese", "indian", "spanish", "italian", "russian", "else"], corpus_path="dataset/total_names_corpus")
+# preprocess_groups(job_id="8_nationality_groups", groups=["african", "eastAsian", "european", "arabic", "angloAmerican", "hispanic", "scandinavian", "southAsian"], corpus_path="dataset/total_names_corpus")
@@ -7,12 +7,23 @@ import traceback
 from logger import Logging
 from utils import connect_to_db, load_json, write_json
 from preprocessing import preprocess_nationalities, preprocess_groups
-#from preprocessing_groups import preprocess_groups
-from final_model.train_model import trainer
+from corpus import NameCorpus, build_corpus, corpus_exists
+from dataset_cache import DatasetCache
+from final_model.train_model import trainer, model_config as train_config
+from model_registry import ModelRegistry, model_key
 
 
 logger = Logging(log_file="nec.log")
 
+RAW_DATASET_PATH = "dataset/total_names_dataset.pickle"
+CORPUS_PATH = "dataset/total_names_corpus"
+
+# fixed sampling seed, so jobs with the same class selection get the same (cachable) dataset
+PREPROCESSING_SEED = int(os.getenv("PREPROCESSING_SEED", 0))
+
+dataset_cache = DatasetCache(cache_directory="dataset/cache", max_size=int(os.getenv("DATASET_CACHE_SIZE", 2048)))
+model_registry = ModelRegistry(models_directory="nec_user_models")
+
 
 def get_next_job(queue_file: str="") -> Union[int, tuple]:
     if os.stat(queue_file).st_size == 0:
@@ -85,6 +96,53 @@ def push_job_to_db(job_id: str) -> None:
     connection.close()
 
 
+def preprocess_and_train(job_id: str="", nationalities: list=[], is_group_level: bool=False) -> None:
+    # convert the raw dataset into the memory-mappable corpus once, every following job reuses it
+    if not corpus_exists(CORPUS_PATH):
+        logger.info("building name corpus from raw dataset.")
+        start = time.time()
+        build_corpus(raw_dataset_path=RAW_DATASET_PATH, corpus_path=CORPUS_PATH)
+        logger.log("-> finished building name corpus (took: {} seconds).".format(round(time.time() - start, 3)), show_time=False, tab=1)
+
+    # preprocess the data for the next job (or reuse the dataset of a job with the same classes)
+    logger.info("started preprocessing job [{}].".format(job_id))
+    start = time.time()
+
+    dataset_path = "nec_user_models/" + job_id + "/dataset"
+    cache_key = dataset_cache.key(nationalities, is_group_level, PREPROCESSING_SEED, NameCorpus(CORPUS_PATH).version)
+
+    if dataset_cache.fetch(cache_key, dataset_path):
+        logger.log("-> reused cached dataset [{}] for job [{}].".format(cache_key, job_id), show_time=False, tab=1)
+    else:
+        # check if the chosen classes are nationality groups or single nationalities
+        if is_group_level:
+            preprocess_groups(job_id=job_id, groups=nationalities, corpus_path=CORPUS_PATH, seed=PREPROCESSING_SEED)
+        else:
+            preprocess_nationalities(job_id=job_id, nationalities=nationalities, corpus_path=CORPUS_PATH, seed=PREPROCESSING_SEED)
+
+        try:
+            dataset_cache.store(cache_key, dataset_path)
+        except Exception as err:
+            logger.warn("couldn't cache dataset of job [{}]: {}".format(job_id, err))
+
+    logger.log("-> finished preprocessing job [{}] (took: {} seconds).".format(job_id, round(time.time() - start, 3)), show_time=False, tab=1)
+
+    # initialize train setup
+    train_job = trainer(job_id=job_id)
+
+    # train job
+    logger.info("started training job [{}].".format(job_id))
+    start = time.time()
+    train_job.train()
+    logger.log("-> finished training job [{}] (took: {} seconds).".format(job_id, round(time.time() - start, 3)), show_time=False, tab=1)
+
+    # evaluate job
+    logger.info("starting evaluting job [{}].".format(job_id))
+    start = time.time()
+    train_job.test()
+    logger.log("-> finished evaluting job [{}] (took: {} seconds).".format(job_id, round(time.time() - start, 3)), show_time=False, tab=1)
+
+
 def run_next_job():
     next_job = get_next_job("job_queue.json")
 
@@ -103,32 +161,16 @@ def run_next_job():
             logger.info("creating directory for next job [{}]".format(job_id))
             create_job_space(job_id)
 
-            # preprocess the data for the next job
-            logger.info("started preprocessing job [{}].".format(job_id))
-            start = time.time()
+            # reuse an already trained model with the same classes and train configuration instead of training again
+            key = model_key(nationalities, is_group_level, train_config)
+            trained_model_id = model_registry.find(key)
 
-            # check if the chosen classes are nationality groups or single nationalities
-            if is_group_level:
-                preprocess_groups(job_id=job_id, groups=nationalities, raw_dataset_path="dataset/total_names_dataset.pickle")
+            if trained_model_id is not None:
+                logger.info("job [{}] matches the trained model [{}], reusing it.".format(job_id, trained_model_id))
+                model_registry.reuse(trained_model_id, job_id)
             else:
-                preprocess_nationalities(job_id=job_id, nationalities=nationalities, raw_dataset_path="dataset/total_names_dataset.pickle")
-
-            logger.log("-> finished preprocessing job [{}] (took: {} seconds).".format(job_id, round(time.time() - start, 3)), show_time=False, tab=1)
-
-            # initialize train setup
-            train_job = trainer(job_id=job_id)
-
-            # train job
-            logger.info("started training job [{}].".format(job_id))
-            start = time.time()
-            train_job.train()
-            logger.log("-> finished training job [{}] (took: {} seconds).".format(job_id, round(time.time() - start, 3)), show_time=False, tab=1)
-
-            # evaluate job
-            logger.info("starting evaluting job [{}].".format(job_id))
-            start = time.time()
-            train_job.test()
-            logger.log("-> finished evaluting job [{}] (took: {} seconds).".format(job_id, round(time.time() - start, 3)), show_time=False, tab=1)
+                preprocess_and_train(job_id=job_id, nationalities=nationalities, is_group_level=is_group_level)
+                model_registry.register(job_id, key)
 
             # mark model as trained in the database by setting 'mode=1' and insert the scores
             push_job_to_db(job_id=job_id)